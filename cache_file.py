@@ -0,0 +1,169 @@
+import json
+import zlib
+import numpy as np
+from createPlotUtils import CacheError, debug_print
+from cache_manager import atomic_open
+
+# Binary cache layout:
+#   MAGIC, a little-endian uint32 with the header length, a JSON header,
+#   padding up to a multiple of ALIGNMENT bytes, and finally the payload.
+#   For stats caches, the payload holds the generations (int64), followed by
+#   the median, ci_min and ci_max (float64) arrays, each holding "length"
+#   entries. For array caches, it holds a float64 array of the given "shape"
+#   in row-major order. For manifest caches, it holds "manifest_size" bytes of
+#   UTF-8 encoded JSON.
+MAGIC = b"EAPCACHE"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+# Payloads larger than this (in bytes) are memory-mapped instead of read
+MMAP_THRESHOLD = 2**24
+
+
+def is_binary_cache(file_name):
+    with open(file_name, 'rb') as cache_file:
+        return cache_file.read(len(MAGIC)) == MAGIC
+
+
+def _read_header(cache_file):
+    if cache_file.read(len(MAGIC)) != MAGIC:
+        raise CacheError("Not a binary cache file.")
+    header_length = int.from_bytes(cache_file.read(4), "little")
+    try:
+        header = json.loads(cache_file.read(header_length).decode("utf-8"))
+    except ValueError:
+        raise CacheError("Corrupt cache header.")
+    if header.get("version") != FORMAT_VERSION:
+        raise CacheError("Unsupported cache version: " + str(header.get("version")))
+    offset = len(MAGIC) + 4 + header_length
+    header["offset"] = offset + (-offset % ALIGNMENT)
+    return header
+
+
+def read_header(file_name):
+    """
+    Reads the header of a binary stats cache.
+
+    :return: A dictionary with the format version, the stats method, the step,
+      the max generation, the number of entries and the payload checksum.
+    """
+    with open(file_name, 'rb') as cache_file:
+        return _read_header(cache_file)
+
+
+def _write_cache(file_name, header, payload):
+    header["version"] = FORMAT_VERSION
+    header["checksum"] = zlib.crc32(payload)
+    header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+    offset = len(MAGIC) + 4 + len(header_bytes)
+    with atomic_open(file_name, 'wb') as cache_file:
+        cache_file.write(MAGIC)
+        cache_file.write(len(header_bytes).to_bytes(4, "little"))
+        cache_file.write(header_bytes)
+        cache_file.write(b" " * (-offset % ALIGNMENT))
+        cache_file.write(payload)
+
+
+def _read_payload(file_name, header, payload_size):
+    # The checksum of a memory-mapped payload is not verified, because that
+    # would read every page of it. Caches are written atomically, so only a
+    # truncated file is checked for.
+    if payload_size > MMAP_THRESHOLD:
+        debug_print("cache", "Memory-mapping cache file", file_name)
+        try:
+            return np.memmap(file_name, dtype=np.uint8, mode='r', offset=header["offset"],
+                             shape=(payload_size,))
+        except ValueError:
+            raise CacheError("Cache file " + file_name + " is truncated")
+    with open(file_name, 'rb') as cache_file:
+        cache_file.seek(header["offset"])
+        payload = np.frombuffer(cache_file.read(payload_size), dtype=np.uint8)
+    if len(payload) != payload_size or zlib.crc32(payload) != header["checksum"]:
+        raise CacheError("Checksum mismatch in cache file " + file_name)
+    return payload
+
+
+def write_stats_cache(file_name, generations, median, ci_min, ci_max, **metadata):
+    """
+    Writes a binary stats cache, recording the provided metadata (e.g. stats,
+    step and max_generation) in its header.
+    """
+    payload = b"".join([np.ascontiguousarray(generations, dtype="<i8").tobytes(),
+                        np.ascontiguousarray(median, dtype="<f8").tobytes(),
+                        np.ascontiguousarray(ci_min, dtype="<f8").tobytes(),
+                        np.ascontiguousarray(ci_max, dtype="<f8").tobytes()])
+    header = dict(metadata)
+    header["length"] = len(generations)
+    _write_cache(file_name, header, payload)
+
+
+def read_stats_cache(file_name):
+    """
+    Reads a binary stats cache and verifies its checksum. Large caches are
+    memory-mapped rather than read into memory, and only checked for
+    truncation.
+
+    :return: A tuple (header, generations, median, ci_min, ci_max).
+    """
+    with open(file_name, 'rb') as cache_file:
+        header = _read_header(cache_file)
+    if "length" not in header:
+        raise CacheError("Cache file " + file_name + " does not hold statistics")
+    length = header["length"]
+    payload = _read_payload(file_name, header, length * 8 * 4)
+    generations = payload[:length * 8].view("<i8")
+    median, ci_min, ci_max = payload[length * 8:].view("<f8").reshape(3, length)
+    return header, generations, median, ci_min, ci_max
+
+
+def write_array_cache(file_name, array, **metadata):
+    """
+    Writes a two-dimensional float array to a binary cache, recording the
+    provided metadata (e.g. the size and modification time of the file the
+    array was parsed from) in its header.
+    """
+    header = dict(metadata)
+    header["shape"] = list(array.shape)
+    _write_cache(file_name, header, np.ascontiguousarray(array, dtype="<f8").tobytes())
+
+
+def read_array_cache(file_name):
+    """
+    Reads an array written by write_array_cache and verifies its checksum,
+    unless it is large enough to be memory-mapped.
+
+    :return: A tuple (header, array).
+    """
+    with open(file_name, 'rb') as cache_file:
+        header = _read_header(cache_file)
+    if "shape" not in header:
+        raise CacheError("Cache file " + file_name + " does not hold an array")
+    rows, columns = header["shape"]
+    payload = _read_payload(file_name, header, rows * columns * 8)
+    return header, payload.view("<f8").reshape(rows, columns)
+
+
+def write_manifest_cache(file_name, manifest, **metadata):
+    """
+    Writes a JSON serializable manifest (e.g. the directory listings of a
+    scan for input files) to a binary cache.
+    """
+    payload = json.dumps(manifest, sort_keys=True).encode("utf-8")
+    header = dict(metadata)
+    header["manifest_size"] = len(payload)
+    _write_cache(file_name, header, payload)
+
+
+def read_manifest_cache(file_name):
+    """
+    Reads a manifest written by write_manifest_cache and verifies its
+    checksum.
+
+    :return: A tuple (header, manifest).
+    """
+    with open(file_name, 'rb') as cache_file:
+        header = _read_header(cache_file)
+    if "manifest_size" not in header:
+        raise CacheError("Cache file " + file_name + " does not hold a manifest")
+    payload = _read_payload(file_name, header, header["manifest_size"])
+    return header, json.loads(payload.tobytes().decode("utf-8"))
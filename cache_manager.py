@@ -0,0 +1,215 @@
+import os
+import time
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from createPlotUtils import debug_print
+import global_options as go
+
+try:
+    import fcntl
+except ImportError:
+    # Advisory locks are not available on e.g. Windows, where cache files are
+    # still written atomically, but concurrent jobs may duplicate work.
+    fcntl = None
+
+# Default size, in megabytes, of the cache directory
+CACHE_SIZE = 1024
+
+# Cache managers by cache directory and size, see get_cache_manager
+cache_managers = dict()
+
+# The umask can only be read by setting it, which is not thread-safe, so it
+# is read once while the module is imported.
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+class CacheManager:
+    """
+    Maps cache files to a single cache directory and keeps the total size of
+    that directory within a budget by removing the least recently used files.
+
+    Access times are set explicitly whenever a cache file is read or written,
+    so eviction does not depend on the file system recording them (e.g. when
+    mounted with noatime). Without a cache directory, cache files are stored
+    at their original location and are never evicted.
+    """
+    def __init__(self, cache_dir="", max_size=CACHE_SIZE * 2**20):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get_path(self, file_name):
+        """
+        Returns the path at which the provided cache file should be stored.
+
+        Within the cache directory, the file name is prefixed with a hash of
+        the directory it would otherwise have been written to, such that
+        caches from different experiments do not collide.
+        """
+        if not self.cache_dir:
+            return file_name
+        directory, base_name = os.path.split(os.path.abspath(file_name))
+        dir_hash = hashlib.sha1(directory.encode("utf-8")).hexdigest()[:8]
+        return os.path.join(self.cache_dir, dir_hash + "_" + base_name)
+
+    def touch(self, path):
+        """
+        Marks the provided cache file as recently used.
+        """
+        if self.cache_dir and os.path.exists(path):
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+
+    def add(self, path):
+        """
+        Registers a newly written cache file, evicting older files if the
+        cache directory has grown beyond its budget.
+        """
+        if not self.cache_dir:
+            return
+        self.touch(path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used files from the cache directory until
+        its total size is within budget. The file provided as "keep" is never
+        removed.
+        """
+        if not self.cache_dir or self.max_size <= 0:
+            return
+        entries = []
+        total_size = 0
+        with os.scandir(self.cache_dir) as directory:
+            for entry in directory:
+                # Hidden files are locks and partially written caches
+                if entry.is_file() and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    entries.append((stat.st_atime_ns, stat.st_size, entry.path))
+                    total_size += stat.st_size
+        keep = os.path.abspath(keep) if keep else None
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if os.path.abspath(path) == keep:
+                continue
+            debug_print("cache", "Evicting cache file", path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+
+class CacheLock:
+    """
+    Advisory lock on a cache file, held by the process calculating its
+    contents so that other processes can wait for, and reuse, the result.
+    """
+    def __init__(self, file_name):
+        directory, base_name = os.path.split(file_name)
+        self.file_name = file_name
+        self.lock_file_name = os.path.join(directory, "." + base_name + ".lock")
+        self.lock_file = None
+
+    def acquire(self, blocking=True):
+        """
+        Acquires the lock, waiting for other processes to release it if
+        blocking is True.
+
+        :return: False if the lock is held by another process and blocking is
+          False, True otherwise.
+        """
+        if fcntl is None:
+            return True
+        while True:
+            try:
+                self.lock_file = open(self.lock_file_name, 'a')
+            except OSError:
+                # Without write access there is no cache to protect
+                return True
+            try:
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if not blocking:
+                    self.lock_file.close()
+                    self.lock_file = None
+                    return False
+                print("Waiting for another process to write " + self.file_name + "...")
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+            # The previous holder removes the lock file before releasing it,
+            # in which case we hold a lock on a file nobody else can see.
+            try:
+                if os.path.samestat(os.fstat(self.lock_file.fileno()),
+                                    os.stat(self.lock_file_name)):
+                    return True
+            except FileNotFoundError:
+                pass
+            self.lock_file.close()
+            self.lock_file = None
+
+    def release(self):
+        if self.lock_file is not None:
+            try:
+                os.remove(self.lock_file_name)
+            except OSError:
+                pass
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+@contextmanager
+def atomic_open(file_name, mode='wb'):
+    """
+    Opens a temporary file in the directory of file_name, and renames it to
+    file_name once it has been written successfully. Readers therefore see
+    either the old or the new file, but never a partially written one.
+    """
+    directory, base_name = os.path.split(file_name)
+    fd, temp_file_name = tempfile.mkstemp(prefix="." + base_name + ".", suffix=".tmp",
+                                          dir=directory or ".")
+    try:
+        # Give the file the permissions it would have had if opened normally
+        os.chmod(temp_file_name, 0o666 & ~UMASK)
+        with os.fdopen(fd, mode) as temp_file:
+            yield temp_file
+        os.replace(temp_file_name, file_name)
+    except BaseException:
+        try:
+            os.remove(temp_file_name)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def get_cache_manager():
+    """
+    Returns the CacheManager for the current cache options. Only one manager
+    is created for every cache directory and size, such that the cache
+    directory is not checked for every cache file.
+    """
+    key = (go.get_str("cache_dir"), go.get_int("cache_size") * 2**20)
+    if key not in cache_managers:
+        cache_managers[key] = CacheManager(*key)
+    return cache_managers[key]
+
+
+def add_options():
+    go.add_option("cache_dir", "", nargs=1,
+                  help_str="Directory in which all cache files are stored. If empty, "
+                           "cache files are stored next to the data they were created "
+                           "from.")
+    go.add_option("cache_size", CACHE_SIZE, nargs=1,
+                  help_str="Maximum size, in megabytes, of the cache directory. The least "
+                           "recently used cache files are removed when this size is "
+                           "exceeded. Zero means unlimited.")
@@ -162,7 +162,7 @@ def plot_annotations(ax):
         linestyle = go.get_str("line_from_file_linestyle", index, when_not_exist=go.RETURN_FIRST)
         linewidth = go.get_float("line_from_file_linewidth", index, when_not_exist=go.RETURN_FIRST)
         column_parser = ParseColumns([x_column, y_column])
-        pf.read_file(line_file, column_parser)
+        pf.read_file(line_file, column_parser, [x_column, y_column])
         ax.plot(column_parser.data[x_column],
                 column_parser.data[y_column],
                 color=color,
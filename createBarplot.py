@@ -15,6 +15,7 @@ import global_options as go
 import parse_file as pf
 import treatment_list as tl
 import configure_plots as cp
+import cache_manager as cm
 
 
 # Derived defaults
@@ -109,12 +110,20 @@ class MedianAndCI:
 
 
 class RawData:
-    def __init__(self):
+    def __init__(self, options=None):
         self.x_data_raw = dict()
         self.x_data_binned = dict()
         self.y_data = dict()
         self.map = dict()
 
+        # Read global data once, rather than for every value added
+        if options is None:
+            options = go.get_snapshot()
+        self.bin_greater_than = options.get_any("bin_greater_than")
+        if self.bin_greater_than is not None:
+            self.bin_greater_than = float(self.bin_greater_than)
+        self.x_bin_size = options.get_float("x_bin_size")
+
     def get_x_data(self, y_data_column):
         return self.x_data_binned[y_data_column]
 
@@ -125,8 +134,8 @@ class RawData:
         return self.y_data[y_data_column]
 
     def add(self, y_data_column, x_value, y_value):
-        bin_greater_than = go.get_any("bin_greater_than")
-        x_bin_size = go.get_float("x_bin_size")
+        bin_greater_than = self.bin_greater_than
+        x_bin_size = self.x_bin_size
 
         if y_data_column not in self.x_data_raw:
             self.x_data_raw[y_data_column] = list()
@@ -139,10 +148,8 @@ class RawData:
 
         self.x_data_raw[y_data_column].append(x_value)
 
-        if bin_greater_than is not None:
-            bin_greater_than = float(bin_greater_than)
-            if x_value > bin_greater_than:
-                x_value = bin_greater_than
+        if bin_greater_than is not None and x_value > bin_greater_than:
+            x_value = bin_greater_than
 
         if x_bin_size > 0:
             bin_nr = math.ceil(x_value / x_bin_size)
@@ -197,63 +204,110 @@ class DataSingleTreatment:
 
     def init_raw_data(self):
         # Read global data
-        separator = go.get_str("separator")
-        parse_last_line = go.get_bool("parse_last_line")
-        generation_based_file = go.get_exists("max_generation")
-        generation = go.get_int("max_generation")
+        options = go.get_snapshot()
+        separator = options.get_str("separator")
+        parse_last_line = options.get_bool("parse_last_line")
+        generation_based_file = options.get_exists("max_generation")
+        generation = options.get_int("max_generation")
+        max_split = self._get_max_split()
+        columns = self._get_data_columns(options)
 
         # Init raw data
-        self.raw_data = RawData()
+        self.raw_data = RawData(options)
 
         for file_name in self.treatment.files:
-            with open(file_name, 'r') as separated_file:
+            data = pf.read_sidecar(file_name, options)
+            if data is not None:
+                # The file has been ingested, so use its parsed rows instead
+                if parse_last_line:
+                    rows = data[-1:]
+                elif generation_based_file:
+                    rows = data[data[:, 0] == generation]
+                else:
+                    rows = data
+                for row in rows:
+                    self._add_raw_data(row, columns)
+                continue
+            with pf.open_data_file(file_name) as separated_file:
                 print("Reading raw data from " + file_name + "...")
 
                 # If the first line of the file is a header line, skip it, otherwise start from the beginning again.
-                first_line = separated_file.readline()
-                if not pf.is_header_line(first_line):
-                    util.debug_print("input", "skipping header")
-                    separated_file.seek(0)
+                lines = pf.skip_header(separated_file)
                 if parse_last_line:
                     # Parse only the last line of the input files,
                     # useful to plot the properties of the last generation
                     # of an evolutionary run.
                     util.debug_print("input", "parsing last line only")
-                    for line in separated_file:
+                    for line in lines:
                         last_line = line
-                    self._add_raw_data(last_line.split(separator))
+                    self._add_raw_data(last_line.split(separator, max_split), columns)
                 elif generation_based_file:
                     # Parse the file, assuming that the first number on each line indicates the current generation
                     util.debug_print("input", "parsing as generation based file")
-                    for line in separated_file:
-                        split_line = line.split(separator)
+                    for line in lines:
+                        split_line = line.split(separator, max_split)
                         if int(split_line[0]) == generation:
-                            self._add_raw_data(line.split(separator))
+                            self._add_raw_data(split_line, columns)
                 else:
                     # Parse the entire file as raw data without making any assumptions
                     util.debug_print("input", "parsing as raw data")
-                    for line in separated_file:
-                        self._add_raw_data(line.split(separator))
-
-    def _add_raw_data(self, split_line):
+                    for line in lines:
+                        self._add_raw_data(line.split(separator, max_split), columns)
+
+    def _get_max_split(self):
+        """
+        Returns the number of splits needed to reach the last column used by
+        _add_raw_data, such that lines need not be split beyond it, or -1 if
+        lines have to be split completely.
+        """
         # Read global data
         read_x_data = go.get_exists("x_data_column")
         x_data_column = go.get_int("x_data_column")
         y_data_columns = go.get_int_list("y_data_column")
-        one_plot_per_treatment = go.get_bool("one_plot_per_treatment")
+        generation_based_file = go.get_exists("max_generation")
+
+        columns = [int(y_data_column) for y_data_column in y_data_columns]
+        if read_x_data:
+            columns.append(x_data_column)
+        if generation_based_file:
+            columns.append(0)
+        if min(columns) < 0:
+            # Columns counted from the end of the line
+            return -1
+        return max(columns) + 1
+
+    def _get_data_columns(self, options):
+        """
+        Resolves the options _add_raw_data needs for every line, once per
+        treatment.
+
+        :return: A tuple (x_data_column, y_data_columns, x_value), where
+          x_data_column is None if the x value is not read from the data, in
+          which case x_value is used instead.
+        """
+        # Read global data
+        read_x_data = options.get_exists("x_data_column")
+        x_data_column = options.get_int("x_data_column")
+        y_data_columns = options.get_int_list("y_data_column")
+        one_plot_per_treatment = options.get_bool("one_plot_per_treatment")
+
+        y_data_columns = [int(y_data_column) for y_data_column in y_data_columns]
+        if x_data_column < 0 or not read_x_data:
+            x_data_column = None
+        if one_plot_per_treatment:
+            return x_data_column, y_data_columns, 0
+        return x_data_column, y_data_columns, self.treatment.get_id()
 
-        if x_data_column >= 0 and read_x_data:
+    def _add_raw_data(self, split_line, columns):
+        x_data_column, y_data_columns, x_value = columns
+        if x_data_column is not None:
             x_value = float(split_line[x_data_column])
-        elif one_plot_per_treatment:
-            x_value = 0
-        else:
-            x_value = self.treatment.get_id()
         if self.max_x is None or self.max_x < x_value:
             self.max_x = x_value
         if self.min_x is None or self.min_x > x_value:
             self.min_x = x_value
         for y_data_column in y_data_columns:
-            self.raw_data.add(y_data_column, x_value, float(split_line[int(y_data_column)]))
+            self.raw_data.add(y_data_column, x_value, float(split_line[y_data_column]))
 
     def init_median_and_ci(self):
         # Get global data
@@ -268,10 +322,11 @@ class DataSingleTreatment:
         self.median_and_ci = MedianAndCI()
 
         # Calculate median and confidence intervals
+        debug_input = util.get_debug_print("input")
         for column in self.get_raw_data().map.keys():
             for key in self.get_raw_data().map[column].keys():
                 item = self.get_raw_data().map[column][key]
-                util.debug_print("input", "calculating median and ci over:", item)
+                debug_input("calculating median and ci over:", item)
                 if bootstrap:
                     if plot_means:
                         median, ci_min, ci_max = util.calc_stats(item, "mean_and_bootstrap_pivotal")
@@ -283,7 +338,7 @@ class DataSingleTreatment:
                         median, ci_min, ci_max = util.calc_mean_and_std_error(item)
                     else:
                         median, ci_min, ci_max = util.calc_median_and_interquartile_range(item)
-                util.debug_print("input", "median:", median, "ci:", ci_min, ci_max)
+                debug_input("median:", median, "ci:", ci_min, ci_max)
                 self.median_and_ci.add(column, key, median, ci_min, ci_max, len(item))
 
     def merge(self, other):
@@ -519,6 +574,7 @@ def add_options():
     tl.add_options()
     pf.add_options()
     cp.add_options()
+    cm.add_options()
 
     # Directory settings
     # go.add_option("templates", ".*")
@@ -7,6 +7,7 @@ import collections
 import treatment_list as tl
 import parse_file as pf
 import configure_plots as cp
+import cache_manager as cm
 import matplotlib.pyplot as plt
 import matplotlib.lines as mlines
 import matplotlib.gridspec as gs
@@ -90,7 +91,13 @@ def parse_one_population_per_line(file_name):
             return generation >= max_generation_to_plot
         return False
 
-    pf.read_file(file_name, process_line)
+    # Without an end column, every column of the line is used
+    columns = None
+    if par_column_end is not None:
+        indiv_idxs = [par_obj1_idx, par_obj2_idx, par_fit_idx]
+        columns = [j + idx for j in range(par_column_start, par_column_end, par_columns_per_indiv)
+                   for idx in indiv_idxs]
+    pf.read_file(file_name, process_line, columns)
     return populations
 
 
@@ -128,6 +135,7 @@ def parse_options():
     tl.add_options()
     pf.add_options()
     cp.add_options()
+    cm.add_options()
 
     go.set_glb("file_names", def_file_name)
     go.set_glb("titles", def_title)
@@ -4,17 +4,40 @@ import os.path
 import re
 
 import numpy as np
-import scikits.bootstrap as bs
 import scipy.stats as st
 
 
 import io
-import random
-import quantiles
+import functools
 from enum import Enum
+from concurrent.futures import Future
 
 
 
+# Default maximum size, in megabytes, of a bootstrap resample tensor
+BOOTSTRAP_CHUNK_SIZE = 256
+
+# Number of generations for which statistics are calculated as a single task.
+# Because every block draws from its own random stream, changing this value
+# changes bootstrapped results, while changing the number of workers does not.
+STATS_BLOCK_SIZE = 1024
+
+# Statistics for which calc_stats_array resamples many generations at once.
+# As before, the pi and abc methods are calculated with the bca method.
+BATCHED_BOOTSTRAP_STATS = {
+    'median_and_bootstrap_percentile': (np.median, 'percentile'),
+    'median_and_bootstrap_pivotal': (np.median, 'pivotal'),
+    'mean_and_bootstrap_percentile': (np.mean, 'percentile'),
+    'mean_and_bootstrap_pivotal': (np.mean, 'pivotal'),
+    'median_and_bootstrap_bca': (np.median, 'bca'),
+    'median_and_bootstrap_pi': (np.median, 'bca'),
+    'median_and_bootstrap_abc': (np.median, 'bca'),
+    'mean_and_bootstrap_bca': (np.mean, 'bca'),
+    'mean_and_bootstrap_pi': (np.mean, 'bca'),
+    'mean_and_bootstrap_abc': (np.mean, 'bca'),
+}
+
+
 ###################
 #### EXCEPTIONS ###
 ###################
@@ -107,22 +130,16 @@ def bootstrap(data, ci=0.95, n_samples=10000, statfunction=np.mean, method=''):
         ci_min, ci_max = my_bootstrap(data, ci, n_samples, is_pivotal, statfunction)
     else:
         # 'pi', 'bca', or 'abc'
-        try:
-            ci_min, ci_max = bs.ci(data=data,
-                                   statfunction=statfunction,
-                                   n_samples=n_samples,
-                                   method='bca',
-                                   alpha=1-ci)
-        except IndexError:
-            ci_min = stat
-            ci_max = stat
+        values = np.asarray(data, dtype=float).reshape(-1, 1)
+        _, ci_min, ci_max = bootstrap_array(values, ci, n_samples, statfunction, 'bca')
+        ci_min, ci_max = ci_min[0], ci_max[0]
     return stat, ci_min, ci_max
 
 
 def my_bootstrap(data, ci=0.95, n_samples=10000, is_pivotal=True, statfunction=np.mean):
     """
-    While our method is much slower, it does not throw an exception when the
-    median value exists twice in the data.
+    Unlike the bca method, our method does not break down when the median
+    value exists twice in the data.
 
     To recap, let "f" be the true probability distribution from which we have drawn our data.
     - "statfunction" or "T" is the parameter of "f" that we want to estimate, such as its mean.
@@ -164,28 +181,153 @@ def my_bootstrap(data, ci=0.95, n_samples=10000, is_pivotal=True, statfunction=n
     And this is high:
     high = 2 * stat_val - bootstrap_stat_values[0.025]
     """
-    statistics = np.zeros(n_samples)
-    for i in range(n_samples):
-        samples = []
-        for j in range(len(data)):
-            samples.append(random.choice(data))
-        stat = statfunction(samples)
-        statistics[i] = stat
+    values = np.asarray(data, dtype=float).reshape(-1, 1)
+    statistics = bootstrap_distribution(values, statfunction, n_samples)
     inv = float(1.0-ci)/2.0
     stat_val = statfunction(data)
+    low, high = np.quantile(statistics[:, 0], [inv, 1.0-inv])
     if is_pivotal:
-        low = 2 * stat_val - quantiles.quantile(statistics, 1.0-inv)
-        high = 2 * stat_val - quantiles.quantile(statistics, inv)
-        # print(high, low, 'quantiles:',
-        # quantiles.quantile(statistics, 1.0-inv),
-        #       quantiles.quantile(statistics, inv), 2 * stat_val)
-    else:
-        high = quantiles.quantile(statistics, 1.0-inv)
-        low = quantiles.quantile(statistics, inv)
-#     print(statistics)
+        low, high = 2 * stat_val - high, 2 * stat_val - low
     return low, high
 
 
+def bootstrap_distribution(data, statfunction=np.mean, n_samples=10000,
+                           chunk_size=BOOTSTRAP_CHUNK_SIZE, rng=None):
+    """
+    Draws "n_samples" bootstrap samples for every column of "data" at once.
+
+    :param data: A (n x columns) array without missing values.
+    :param statfunction: A numpy function accepting an "axis" argument.
+    :param chunk_size: Maximum size, in megabytes, of the resample tensor.
+      Columns are processed in blocks small enough to stay below this size.
+    :param rng: The numpy random Generator to draw from.
+    :return: A (n_samples x columns) array of bootstrapped statistics.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    n, nb_columns = data.shape
+    statistics = np.empty((n_samples, nb_columns))
+    # Both the index tensor and the gathered samples take 8 bytes per element
+    block = max(1, int(chunk_size * 2**20) // (16 * n_samples * max(n, 1)))
+    for start in range(0, nb_columns, block):
+        stop = min(start + block, nb_columns)
+        index = rng.integers(0, n, size=(n_samples, n, stop - start))
+        samples = data[index, np.arange(start, stop)]
+        statistics[:, start:stop] = statfunction(samples, axis=1)
+    return statistics
+
+
+def jackknife_distribution(data, statfunction=np.mean, chunk_size=BOOTSTRAP_CHUNK_SIZE):
+    """
+    Calculates the leave-one-out statistics for every column of "data" at once.
+
+    :param data: A (n x columns) array without missing values, where n > 1.
+    :return: A (n x columns) array where row i holds the statistic calculated
+      without the i-th value.
+    """
+    n, nb_columns = data.shape
+    if statfunction is np.mean:
+        return (np.sum(data, axis=0) - data) / (n - 1)
+    # Row i of index skips the i-th value
+    index = np.arange(n - 1) + (np.arange(n - 1) >= np.arange(n)[:, np.newaxis])
+    statistics = np.empty((n, nb_columns))
+    block = max(1, int(chunk_size * 2**20) // (8 * n * n))
+    for start in range(0, nb_columns, block):
+        stop = min(start + block, nb_columns)
+        samples = data[index[:, :, np.newaxis], np.arange(start, stop)]
+        statistics[:, start:stop] = statfunction(samples, axis=1)
+    return statistics
+
+
+def bca_interval(data, stat_val, statistics, ci=0.95, statfunction=np.mean,
+                 chunk_size=BOOTSTRAP_CHUNK_SIZE):
+    """
+    Calculates the bias-corrected and accelerated (BCa) interval for every
+    column of "data", following the scikits.bootstrap implementation.
+
+    :param data: A (n x columns) array without missing values.
+    :param stat_val: The statistic calculated over every column of "data".
+    :param statistics: A (n_samples x columns) array of bootstrapped
+      statistics, which is sorted in place.
+    :return: A tuple (low, high, degenerate), where "degenerate" marks the
+      columns for which the interval is undefined, which happens when the
+      jackknife statistics are all equal (e.g. a repeated median value).
+    """
+    n_samples = statistics.shape[0]
+    n = data.shape[0]
+    if n < 2:
+        return stat_val.copy(), stat_val.copy(), np.ones(data.shape[1], dtype=bool)
+    statistics.sort(axis=0)
+    alphas = np.array([(1.0-ci)/2.0, 1.0-(1.0-ci)/2.0])[:, np.newaxis]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Bias correction
+        z0 = st.norm.ppf(np.sum(statistics < stat_val, axis=0) / n_samples)
+
+        # Acceleration
+        jack_stats = jackknife_distribution(data, statfunction, chunk_size)
+        jack_diff = np.mean(jack_stats, axis=0) - jack_stats
+        acceleration = (np.sum(jack_diff ** 3, axis=0) /
+                        (6.0 * np.sum(jack_diff ** 2, axis=0) ** 1.5))
+
+        zs = z0 + st.norm.ppf(alphas)
+        avals = st.norm.cdf(z0 + zs / (1 - acceleration * zs))
+    degenerate = np.any(np.isnan(avals), axis=0)
+    nvals = np.round((n_samples - 1) * np.nan_to_num(avals)).astype(int)
+    low, high = np.take_along_axis(statistics, nvals, axis=0)
+    low[degenerate] = stat_val[degenerate]
+    high[degenerate] = stat_val[degenerate]
+    return low, high, degenerate
+
+
+def bootstrap_array(values, ci=0.95, n_samples=10000, statfunction=np.mean, method='percentile',
+                    chunk_size=BOOTSTRAP_CHUNK_SIZE, rng=None):
+    """
+    Vectorized version of bootstrap for every column of a
+    (runs x generations) array, where NaN marks a missing value.
+
+    Columns are grouped by their number of values, such that every group
+    can be resampled as a single dense array. When the bca interval is
+    undefined for a column, a zero-width interval is returned and a warning
+    reports the number of affected columns.
+
+    :return: A tuple (stat, ci_min, ci_max) of arrays with one entry per
+      column.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    missing = np.isnan(values)
+    counts = np.sum(~missing, axis=0)
+    # Move the available values of every column to the top
+    compacted = np.take_along_axis(values, np.argsort(missing, axis=0, kind='stable'), axis=0)
+    stat = np.full(values.shape[1], np.nan)
+    ci_min = np.full(values.shape[1], np.nan)
+    ci_max = np.full(values.shape[1], np.nan)
+    inv = float(1.0-ci)/2.0
+    nb_degenerate = 0
+    for n in np.unique(counts):
+        if n == 0:
+            continue
+        columns = np.flatnonzero(counts == n)
+        data = compacted[:n, columns]
+        stat_val = statfunction(data, axis=0)
+        statistics = bootstrap_distribution(data, statfunction, n_samples, chunk_size, rng)
+        if method == 'bca':
+            low, high, degenerate = bca_interval(data, stat_val, statistics, ci, statfunction,
+                                                 chunk_size)
+            nb_degenerate += np.sum(degenerate)
+        else:
+            low, high = np.quantile(statistics, [inv, 1.0-inv], axis=0)
+            if method == 'pivotal':
+                low, high = 2 * stat_val - high, 2 * stat_val - low
+        stat[columns] = stat_val
+        ci_min[columns] = low
+        ci_max[columns] = high
+    if nb_degenerate > 0:
+        print("Warning: bca interval undefined for", nb_degenerate, "of", values.shape[1],
+              "generations (all jackknife statistics are equal), using a zero-width interval.")
+    return stat, ci_min, ci_max
+
+
 def calc_stats(data, stats, ci=0.95, n_samples=2000):
     if stats == 'median_and_interquartile_range':
         return calc_median_and_interquartile_range(data)
@@ -246,6 +388,104 @@ def calc_mean_and_std_error(data):
     return median, ci_min, ci_max
 
 
+def calc_stats_array(values, stats, ci=0.95, n_samples=2000, chunk_size=BOOTSTRAP_CHUNK_SIZE,
+                     rng=None):
+    """
+    Calculates the requested statistics for every column of a
+    (runs x generations) array, where NaN marks a missing value.
+
+    :param chunk_size: Maximum size, in megabytes, of the bootstrap resample
+      tensor.
+    :param rng: The numpy random Generator used for bootstrapping.
+    :return: A tuple (median, ci_min, ci_max) of arrays with one entry per
+      column.
+    """
+    if stats == 'median_and_interquartile_range':
+        return calc_median_and_interquartile_range_array(values)
+    elif stats == 'mean_and_std_error':
+        return calc_mean_and_std_error_array(values)
+    elif stats in BATCHED_BOOTSTRAP_STATS:
+        statfunction, method = BATCHED_BOOTSTRAP_STATS[stats]
+        return bootstrap_array(values, ci, n_samples, statfunction, method, chunk_size, rng)
+    median = np.zeros(values.shape[1])
+    ci_min = np.zeros(values.shape[1])
+    ci_max = np.zeros(values.shape[1])
+    for i in range(values.shape[1]):
+        data = values[:, i]
+        median[i], ci_min[i], ci_max[i] = calc_stats(data[~np.isnan(data)], stats, ci, n_samples)
+    return median, ci_min, ci_max
+
+
+def submit_stats_blocks(values, stats, root_seed, seed_key, executor=None,
+                        chunk_size=BOOTSTRAP_CHUNK_SIZE, block_size=STATS_BLOCK_SIZE):
+    """
+    Splits the columns of a (runs x generations) array into blocks and
+    calculates the requested statistics for every block.
+
+    Every block gets its own random stream, spawned from "root_seed" with key
+    "seed_key" + (block index,), such that the results do not depend on
+    whether, or by how many processes, the blocks are calculated in parallel.
+
+    :param executor: A concurrent.futures executor to submit the blocks to.
+      If None, the blocks are calculated immediately.
+    :return: A list with one result (or future result) per block, to be
+      passed to collect_stats_blocks.
+    """
+    blocks = []
+    for block, start in enumerate(range(0, values.shape[1], block_size)):
+        seed_sequence = np.random.SeedSequence(root_seed, spawn_key=tuple(seed_key) + (block,))
+        args = (values[:, start:start + block_size], stats)
+        kwargs = dict(chunk_size=chunk_size, rng=np.random.default_rng(seed_sequence))
+        if executor is None:
+            blocks.append(calc_stats_array(*args, **kwargs))
+        else:
+            blocks.append(executor.submit(calc_stats_array, *args, **kwargs))
+    return blocks
+
+
+def collect_stats_blocks(blocks):
+    """
+    Merges the results of submit_stats_blocks back in generation order.
+
+    :return: A tuple (median, ci_min, ci_max) of arrays with one entry per
+      column.
+    """
+    results = [block.result() if isinstance(block, Future) else block for block in blocks]
+    if len(results) == 0:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    median, ci_min, ci_max = zip(*results)
+    return np.concatenate(median), np.concatenate(ci_min), np.concatenate(ci_max)
+
+
+def calc_median_and_interquartile_range_array(values):
+    """
+    Vectorized version of calc_median_and_interquartile_range, producing
+    bit-identical results for every column of a (runs x generations) array.
+    """
+    data_sorted = np.sort(values, axis=0)  # NaN values are sorted to the end
+    counts = np.sum(~np.isnan(values), axis=0)
+    columns = np.arange(values.shape[1])
+    median = (data_sorted[(counts - 1) // 2, columns] + data_sorted[counts // 2, columns]) / 2
+    ci_min = data_sorted[(0.25 * counts).astype(int), columns]
+    ci_max = data_sorted[(0.75 * counts).astype(int), columns]
+    return median, ci_min, ci_max
+
+
+def calc_mean_and_std_error_array(values):
+    """
+    Vectorized version of calc_mean_and_std_error for every column of a
+    (runs x generations) array.
+    """
+    missing = np.isnan(values)
+    counts = np.sum(~missing, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.sum(np.where(missing, 0, values), axis=0) / counts
+        squared_error = np.where(missing, 0, values - mean) ** 2
+        std_error = np.sqrt(np.sum(squared_error, axis=0) / (counts - 1)) / np.sqrt(counts)
+    std_error[counts <= 1] = 0
+    return mean, mean - std_error, mean + std_error
+
+
 # def calc_mean_and_bootstrap(data, n_samples=2000):
 #     data_sorted = sorted(data)
 #     median = np.mean(data_sorted)
@@ -268,6 +508,65 @@ def mann_whitney_u(data1, data2):
     return p_value
 
 
+def mann_whitney_u_array(values1, values2):
+    """
+    Vectorized version of mann_whitney_u for every column of two
+    (runs x generations) arrays, where NaN marks a missing value.
+
+    Both samples are ranked together once, after which U, the tie correction
+    and the two-sided normal approximation (with continuity correction) are
+    calculated for all columns at once, as in scipy.stats.mannwhitneyu.
+    Columns for which scipy would calculate the exact p-value (a sample of at
+    most 8 values and no ties) are passed to scipy instead.
+
+    :return: A tuple (u_statistic, p_value) of arrays with one entry per
+      column, where u_statistic is the U statistic of the first sample.
+    """
+    combined = np.concatenate([values1, values2])
+    missing = np.isnan(combined)
+    n1 = np.sum(~np.isnan(values1), axis=0)
+    n2 = np.sum(~np.isnan(values2), axis=0)
+    n = n1 + n2
+
+    # Rank all values of a column, assigning tied values their average rank.
+    # Missing values are sorted to the end, so they do not affect the ranks.
+    order = np.argsort(combined, axis=0, kind='stable')
+    data_sorted = np.take_along_axis(combined, order, axis=0)
+    positions = np.broadcast_to(np.arange(1, combined.shape[0] + 1)[:, np.newaxis], combined.shape)
+    new_value = np.ones(combined.shape, dtype=bool)
+    new_value[1:] = data_sorted[1:] != data_sorted[:-1]
+    last_value = np.ones(combined.shape, dtype=bool)
+    last_value[:-1] = new_value[1:]
+    rank_min = np.maximum.accumulate(np.where(new_value, positions, 0), axis=0)
+    rank_max = np.minimum.accumulate(np.where(last_value, positions, combined.shape[0])[::-1],
+                                     axis=0)[::-1]
+    ranks = np.empty(combined.shape)
+    np.put_along_axis(ranks, order, (rank_min + rank_max) / 2, axis=0)
+    ranks[missing] = 0
+
+    # A group of t tied values adds t^3 - t to the tie term, or t^2 - 1 per value
+    tie_sizes = rank_max - rank_min + 1
+    sorted_missing = np.take_along_axis(missing, order, axis=0)
+    tie_term = np.sum(np.where(sorted_missing, 0, tie_sizes ** 2 - 1), axis=0)
+
+    u_statistic = np.sum(ranks[:values1.shape[0]], axis=0) - n1 * (n1 + 1) / 2
+    u_max = np.maximum(u_statistic, n1 * n2 - u_statistic)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))))
+        z = (u_max - n1 * n2 / 2 - 0.5) / s
+    p_value = np.clip(2 * st.norm.sf(z), 0, 1)
+    p_value[(n1 == 0) | (n2 == 0)] = 1
+
+    exact = ((n1 <= 8) | (n2 <= 8)) & (tie_term == 0) & (n1 > 0) & (n2 > 0)
+    for i in np.flatnonzero(exact):
+        data1 = values1[:, i]
+        data2 = values2[:, i]
+        u_statistic[i], p_value[i] = st.mannwhitneyu(data1[~np.isnan(data1)],
+                                                     data2[~np.isnan(data2)],
+                                                     alternative="two-sided")
+    return u_statistic, p_value
+
+
 ###################
 ##### CLASSES #####
 ###################
@@ -299,11 +598,34 @@ class bcolors:
 debug_enabled = {}
 
 def debug_print(key, *args):
+    """
+    Prints the provided arguments if debugging is enabled for key. The
+    arguments are only converted to strings once the message is printed, so
+    pass values as separate arguments rather than building the message.
+    """
+    if key not in debug_enabled:
+        return
     message = ""
     for arg in args:
-        message += (str(arg) + " ") 
-    if key in debug_enabled:
-        print(bcolors.OKGREEN + str(key) + bcolors.ENDC, "|", message)
+        message += (str(arg) + " ")
+    print(bcolors.OKGREEN + str(key) + bcolors.ENDC, "|", message)
+
+
+def _no_debug_print(*args):
+    pass
+
+
+def get_debug_print(key):
+    """
+    Returns a function that prints its arguments like debug_print does for
+    the provided key. If debugging is disabled for key, the function does
+    nothing at all, which makes it cheap enough to call for every line or
+    value. Debugging is enabled while the options are parsed, so get the
+    function after parsing them.
+    """
+    if key not in debug_enabled:
+        return _no_debug_print
+    return functools.partial(debug_print, key)
 
 
 ###################
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import warnings
 import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
@@ -9,6 +10,9 @@ import treatment_list as tl
 import parse_file as pf
 import configure_plots as cp
 import global_options as go
+import cache_file as cf
+import cache_manager as cm
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from createPlotUtils import *
 
 __author__ = "Joost Huizinga"
@@ -55,50 +59,124 @@ def def_sig_marker(): return [go.get_str("marker", index) for index in go.get_in
 ###################
 
 class MedianAndCI:
-    def __init__(self):
-        self.median = dict()
-        self.ci_min = dict()
-        self.ci_max = dict()
+    """
+    The central tendency and confidence interval of a plot column, stored as
+    arrays with one entry per plotted generation, in generation order.
+    """
+    def __init__(self, generations=None, median=None, ci_min=None, ci_max=None):
+        self.set_arrays(generations if generations is not None else [],
+                        median if median is not None else [],
+                        ci_min if ci_min is not None else [],
+                        ci_max if ci_max is not None else [])
 
     def __len__(self):
         return len(self.median)
 
+    def set_arrays(self, generations, median, ci_min, ci_max):
+        self.generations = np.asarray(generations, dtype=np.int64)
+        self.median = np.asarray(median, dtype=float)
+        self.ci_min = np.asarray(ci_min, dtype=float)
+        self.ci_max = np.asarray(ci_max, dtype=float)
+
     def add(self, generation, median, ci_min, ci_max):
-        self.median[generation] = median
-        self.ci_min[generation] = ci_min
-        self.ci_max[generation] = ci_max
+        # Appending copies all arrays, prefer set_arrays for bulk data.
+        self.set_arrays(np.append(self.generations, generation),
+                        np.append(self.median, float(median)),
+                        np.append(self.ci_min, float(ci_min)),
+                        np.append(self.ci_max, float(ci_max)))
 
-    def to_cache(self, cache_file_name):
-        sorted_keys = sorted(self.median)
-        median_array = self.get_median_array()
-        ci_min_array = self.get_ci_min_array()
-        ci_max_array = self.get_ci_max_array()
+    def to_cache(self, cache_file_name, **metadata):
+        print("Writing " + cache_file_name + "...")
+        cf.write_stats_cache(cache_file_name, self.generations, self.median, self.ci_min,
+                             self.ci_max, **metadata)
+        cm.get_cache_manager().add(cache_file_name)
 
-        with open(cache_file_name, 'w') as cache_file:
-            print("Writing " + cache_file_name + "...")
-            for i in range(len(median_array)):
-                cache_file.write(str(median_array[i]) + " ")
-                cache_file.write(str(ci_min_array[i]) + " ")
-                cache_file.write(str(ci_max_array[i]) + " ")
-                cache_file.write(str(sorted_keys[i]) + "\n")
+    def get_generations(self):
+        return self.generations
 
     def get_median_array(self):
-        return dict_to_np_array(self.median)
+        return self.median
 
     def get_ci_min_array(self):
-        return dict_to_np_array(self.ci_min)
+        return self.ci_min
 
     def get_ci_max_array(self):
-        return dict_to_np_array(self.ci_max)
+        return self.ci_max
+
+
+class Comparison:
+    """
+    The results of the statistical test between two treatments, stored as
+    arrays with one entry per tested generation, in generation order.
+    """
+    def __init__(self, generations=None, statistics=None, p_values=None):
+        self.generations = np.asarray(generations if generations is not None else [],
+                                      dtype=np.int64)
+        self.statistics = np.asarray(statistics if statistics is not None else [], dtype=float)
+        self.p_values = np.asarray(p_values if p_values is not None else [], dtype=float)
+
+    def __len__(self):
+        return len(self.generations)
+
+    def get_significant(self, p_threshold):
+        return self.generations[self.p_values < p_threshold]
+
+
+class RawColumn:
+    """
+    Read-only view on the data of a single plot column.
+
+    Mirrors the dictionary interface of the old raw data, mapping a generation
+    to the values of all runs that have data for that generation.
+    """
+    def __init__(self, generations, values):
+        self.generations = generations
+        self.values = values
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, generation):
+        return generation in self.keys()
+
+    def __getitem__(self, generation):
+        index = np.searchsorted(self.generations, generation)
+        if index >= len(self.generations) or self.generations[index] != generation:
+            raise KeyError(generation)
+        values = self.values[:, index]
+        return values[~np.isnan(values)]
+
+    def keys(self):
+        """Returns the sorted array of generations for which there is data."""
+        return self.generations[self.get_mask()]
+
+    def get_mask(self):
+        return np.any(~np.isnan(self.values), axis=0)
+
+    def get_max_generation(self):
+        return self.keys().max()
 
 
 class RawData:
+    """
+    Columnar store for the raw data of a treatment.
+
+    Every plot column is stored as a (runs x generations) float array that
+    shares a single, sorted generation index with all other columns. Runs
+    without a value for a generation (e.g. because they stopped early) are
+    padded with NaN.
+
+    If only some lines of the input files were read (see
+    parse_file.LineFilter), "line_filter" holds the filter that was used.
+    """
     def __init__(self):
+        self.generations = np.zeros(0, dtype=np.int64)
         self.raw_data = dict()
         self.max_generation = None
+        self.line_filter = None
 
     def __getitem__(self, plot_id):
-        return self.raw_data[plot_id]
+        return RawColumn(self.generations, self.raw_data[plot_id])
 
     def __contains__(self, plot_id):
         return plot_id in self.raw_data
@@ -109,28 +187,109 @@ class RawData:
                 self.init_max_generation()
             return self.max_generation
         else:
-            return max(self.raw_data[plot_id].keys())
+            return self[plot_id].get_max_generation()
 
-    def add(self, plot_id, generation, value):
-        debug_print("raw_data", "For plot", plot_id, "added:", generation, value)
-        if plot_id not in self.raw_data:
-            self.raw_data[plot_id] = dict()
-        if generation not in self.raw_data[plot_id]:
-            self.raw_data[plot_id][generation] = list()
-        self.raw_data[plot_id][generation].append(value)
+    def get_generations(self):
+        return self.generations
+
+    def get_matrix(self, plot_id):
+        return self.raw_data[plot_id]
+
+    def get_stride(self, generations, step):
+        """
+        Returns the indices of every step-th of the provided generations.
+
+        When lines were filtered while reading, the generations are no
+        longer consecutive, so they are selected by value instead: for
+        consecutive generations starting at zero, both are the same.
+        """
+        if self.line_filter is None:
+            return np.arange(0, len(generations), step)
+        return np.flatnonzero(generations % step == 0)
+
+    def get_nr_of_generations(self, generations):
+        """
+        Returns the number of generations in a run that has data for the
+        provided generations, counting lines that were filtered while
+        reading.
+        """
+        if self.line_filter is None or len(generations) == 0:
+            return len(generations)
+        return generations[-1] + 1
+
+    def add_runs(self, plot_ids, generations, data):
+        """
+        Adds the data of multiple runs at once.
+
+        :param plot_ids: The plot ids (columns) held in data.
+        :param generations: The generation of each entry along the second
+          axis of data.
+        :param data: A (runs x generations x plot_ids) array, where NaN marks
+          a missing value.
+        """
+        generations = np.asarray(generations, dtype=np.int64)
+        all_generations = np.union1d(self.generations, generations)
+        if len(all_generations) != len(self.generations):
+            old_index = np.searchsorted(all_generations, self.generations)
+            for plot_id, values in self.raw_data.items():
+                padded = np.full((values.shape[0], len(all_generations)), np.nan)
+                padded[:, old_index] = values
+                self.raw_data[plot_id] = padded
+            self.generations = all_generations
+
+        new_index = np.searchsorted(self.generations, generations)
+        for i, plot_id in enumerate(plot_ids):
+            if plot_id not in self.raw_data and np.all(np.isnan(data[:, :, i])):
+                continue
+            debug_print("raw_data", "For plot", plot_id, "added", data.shape[0], "runs")
+            values = np.full((data.shape[0], len(self.generations)), np.nan)
+            values[:, new_index] = data[:, :, i]
+            if plot_id in self.raw_data:
+                values = np.concatenate([self.raw_data[plot_id], values])
+            self.raw_data[plot_id] = values
+
+    def add_values(self, plot_ids, generations, values):
+        """
+        Adds individual observations, where each observation is stored in the
+        first run that does not yet have a value for its generation.
+
+        :param plot_ids: The plot ids (columns) held in values.
+        :param generations: The generation of each row in values.
+        :param values: A (observations x plot_ids) array.
+        """
+        generations = np.asarray(generations, dtype=np.int64)
+        order = np.argsort(generations, kind="stable")
+        unique_generations, first, counts = np.unique(generations[order],
+                                                      return_index=True,
+                                                      return_counts=True)
+        nr_of_runs = counts.max() if len(counts) > 0 else 0
+        run_index = np.arange(len(order)) - np.repeat(first, counts)
+        gen_index = np.repeat(np.arange(len(unique_generations)), counts)
+        data = np.full((nr_of_runs, len(unique_generations), len(plot_ids)), np.nan)
+        data[run_index, gen_index, :] = values[order, :]
+        self.add_runs(plot_ids, unique_generations, data)
 
     def get(self, plot_id, generation):
-        return self.raw_data[plot_id][generation]
+        return self[plot_id][generation]
+
+    def get_available_max_generation(self):
+        """
+        Returns the largest generation for which any plot column has data,
+        regardless of the max_generation option.
+        """
+        max_generation = MAX_GEN_NOT_PROVIDED
+        for plot_id in self.raw_data:
+            generations = self.get_max_generation(plot_id)
+            debug_print("plot", "generations:", generations)
+            if generations > max_generation:
+                max_generation = generations
+        return max_generation
 
     def init_max_generation(self):
         # Read global data
         self.max_generation = go.get_int("max_generation")
         if self.max_generation == MAX_GEN_NOT_PROVIDED:
-            for data in self.raw_data.values():
-                generations = max(data.keys())
-                debug_print("plot", "generations: " + str(generations))
-                if generations > self.max_generation:
-                    self.max_generation = generations
+            self.max_generation = self.get_available_max_generation()
 
 
 class DataSingleTreatment:
@@ -140,6 +299,7 @@ class DataSingleTreatment:
         self.median_and_ci = dict()
         self.stats = dict()
         self.max_generation = None
+        self.cache_locks = dict()
 
     def get_raw_data(self):
         if not self.raw_data:
@@ -164,14 +324,41 @@ class DataSingleTreatment:
             self.init_max_generation()
         return self.max_generation
 
+    def get_cache_file_name(self, plot_id, stats=''):
+        return cm.get_cache_manager().get_path(self.treatment.get_cache_file_name(plot_id, stats))
+
+    def get_data_cache_file_names(self, file_names, options=None):
+        """
+        Returns the name of the cache holding the parsed data of each of the
+        provided files, or None if parsed data should not be cached.
+
+        Parsed data is only cached in the "cache_dir", because a cache per
+        input file would otherwise double the number of files in the data
+        directories.
+        """
+        # Read global data
+        if options is None:
+            options = go.get_snapshot()
+        read_cache = options.get_bool("read_cache") and options.get_bool("read_data_cache")
+        write_cache = options.get_bool("write_cache") and options.get_bool("write_data_cache")
+
+        manager = cm.get_cache_manager()
+        if (not read_cache and not write_cache) or not manager.cache_dir:
+            return None
+        return [manager.get_path(self.treatment.get_data_cache_file_name(file_name))
+                for file_name in file_names]
+
     def stats_to_cache(self, stats):
         # Read global data
         to_plot = go.get_int_list("to_plot")
+        step = go.get_int("step")
 
+        max_generation = self.get_raw_data().get_available_max_generation()
         for plot_id in to_plot:
             median_and_ci = self.get_stats(plot_id, stats)
-            filename = self.treatment.get_cache_file_name(plot_id, stats)
-            median_and_ci.to_cache(filename)
+            filename = self.get_cache_file_name(plot_id, stats)
+            median_and_ci.to_cache(filename, stats=stats, step=step,
+                                   max_generation=int(max_generation))
 
     def to_cache(self):
         print('WARNING: to_cache is deprecated')
@@ -180,22 +367,141 @@ class DataSingleTreatment:
 
         for plot_id in to_plot:
             median_and_ci = self.get_median_and_ci(plot_id)
-            median_and_ci.to_cache(self.treatment.get_cache_file_name(plot_id))
+            median_and_ci.to_cache(self.get_cache_file_name(plot_id))
 
     def init_max_generation(self):
         # Read global data
         self.max_generation = go.get_int("max_generation")
         if self.max_generation == MAX_GEN_NOT_PROVIDED:
-            raw_data = self.get_raw_data()
-            self.max_generation = raw_data.get_max_generation()
+            cached_max_generation = self.get_cached_max_generation()
+            if cached_max_generation is not None:
+                self.max_generation = cached_max_generation
+            else:
+                raw_data = self.get_raw_data()
+                self.max_generation = raw_data.get_max_generation()
+
+    def get_cached_max_generation(self):
+        """
+        Returns the max generation recorded in the header of the stats cache
+        of this treatment, such that a cached plot does not have to read any
+        raw data. Returns None if no such cache is available.
+        """
+        # Read global data
+        read_cache = go.get_bool("read_cache") and go.get_bool("read_median_ci_cache")
+        to_plot = go.get_int_list("to_plot")
+        stats = go.get_str('stats')
+
+        # Backwards compatibility with outdated bootstrap option
+        if go.get_bool("bootstrap"):
+            stats = 'median_and_bootstrap_percentile'
+
+        if not read_cache:
+            return None
+        for plot_id in to_plot:
+            try:
+                header = read_cache_header(self.get_cache_file_name(plot_id, stats))
+            except IOError:
+                continue
+            if "max_generation" in header:
+                return int(header["max_generation"])
+        return None
 
     def init_raw_data(self):
+        options = go.get_snapshot()
+        self.finish_raw_data(self.start_raw_data(options=options), options)
+
+    def get_file_groups(self, options=None):
+        """
+        Returns the files of this treatment, grouped by how they are combined:
+        one group per value for one_value_per_dir, one group per pooled
+        directory when pooling, and a single group of runs otherwise.
+        """
         # Read global data
-        separator = go.get_str("separator")
-        to_plot = go.get_int_list("to_plot")
-        y_column = go.get_int("x_column")
-        one_value_per_dir = go.get_bool("one_value_per_dir")
-        pool = len(go.get_list("pool", default=[])) > 0
+        if options is None:
+            options = go.get_snapshot()
+        one_value_per_dir = options.get_bool("one_value_per_dir")
+        pool = len(options.get_list("pool", default=[])) > 0
+
+        if one_value_per_dir:
+            return self.treatment.parts
+        elif pool:
+            return self.treatment.files_per_pool
+        else:
+            return [self.treatment.files]
+
+    def start_raw_data(self, io_executor=None, parse_executor=None, options=None):
+        """
+        Starts reading the files of this treatment, see
+        parse_file.submit_read_arrays. Only the columns that are plotted are
+        parsed.
+
+        :param options: The global_options.OptionSnapshot to read the options
+          from, which is passed on to parse_file. Defaults to the current
+          snapshot.
+        :return: The pending reads to pass to finish_raw_data.
+        """
+        # Read global data
+        if options is None:
+            options = go.get_snapshot()
+        one_value_per_dir = options.get_bool("one_value_per_dir")
+
+        columns = pf.get_projected_columns(options.get_int_list("to_plot"), options)
+        line_filter = self.get_line_filter(options)
+        pending = []
+        for index, file_names in enumerate(self.get_file_groups(options)):
+            part = None
+            if one_value_per_dir:
+                part = self.read_part_cache(index, file_names, options)
+            if part is None:
+                part = pf.submit_read_arrays(file_names,
+                                             self.get_data_cache_file_names(file_names, options),
+                                             io_executor, parse_executor, columns, line_filter,
+                                             options)
+            pending.append(part)
+        return pending
+
+    def get_line_filter(self, options=None):
+        """
+        Returns the parse_file.LineFilter selecting the lines that are
+        plotted or compared, or None if all lines have to be read.
+
+        Lines can only be skipped when the generation of a line is its line
+        number, and files are read as separate runs.
+        """
+        # Read global data
+        if options is None:
+            options = go.get_snapshot()
+        x_from_file = options.get_bool("x_from_file")
+        x_values_passed = options.get_exists("x_values")
+        one_value_per_dir = options.get_bool("one_value_per_dir")
+        pool = len(options.get_list("pool", default=[])) > 0
+        max_generation = options.get_int("max_generation")
+        strides = [options.get_int("step")]
+        if options.get_bool("sig"):
+            strides.append(options.get_int("stat_test_step"))
+
+        if x_from_file or x_values_passed or one_value_per_dir or pool:
+            return None
+        if max_generation == MAX_GEN_NOT_PROVIDED:
+            if 1 in strides:
+                return None
+            return pf.LineFilter(strides)
+        # The max generation itself is read, such that the data is known to
+        # extend until the max generation.
+        return pf.LineFilter(strides, max_generation + 1)
+
+    def finish_raw_data(self, pending, options=None):
+        """
+        Waits for the reads started by start_raw_data and combines the files
+        into the raw data of this treatment.
+        """
+        # Read global data
+        if options is None:
+            options = go.get_snapshot()
+        to_plot = options.get_int_list("to_plot")
+        one_value_per_dir = options.get_bool("one_value_per_dir")
+        pool = len(options.get_list("pool", default=[])) > 0
+        pool_reducer = options.get_str("pool_reducer")
 
         # Init raw data
         self.raw_data = RawData()
@@ -204,62 +510,171 @@ class DataSingleTreatment:
             print("Warning: treatment " + self.treatment.get_name() +
                   " has no files associated with it.")
 
+        file_groups = self.get_file_groups(options)
         if one_value_per_dir:
-            generation = 0
-            for file_names in self.treatment.parts:
+            all_generations = []
+            all_values = []
+            for index, (file_names, part) in enumerate(zip(file_groups, pending)):
                 debug_print("files", "Parts: ", file_names)
-                for file_name in file_names:
-                    with open(file_name, 'r') as separated_file:
-                        print("Reading raw data for value " + str(generation) +
-                              " from " + file_name + "...")
-                        pf.skip_header(separated_file)
-                        for line in separated_file:
-                            split_line = pf.get_split_line(line, separator)
-                            self._add(split_line, generation)
-                generation += 1
+                if len(file_names) == 0:
+                    continue
+                # Cached parts were already read by start_raw_data
+                if not isinstance(part, tuple):
+                    part = self.combine_part(index, file_names, part, options)
+                all_generations.append(part[0])
+                all_values.append(part[1])
+            if len(all_values) > 0:
+                self.raw_data.add_values(to_plot,
+                                         np.concatenate(all_generations),
+                                         np.concatenate(all_values))
         elif pool:
-            for dir_name, file_names in zip(self.treatment.dirs,
-                                            self.treatment.files_per_pool):
+            for dir_name, file_names, arrays in zip(self.treatment.dirs, file_groups, pending):
                 print("Pooling for directory: ", dir_name)
-                results = []
-                for file_name in file_names:
-                    with open(file_name, 'r') as separated_file:
-                        print("Reading raw data from " + file_name + "...")
-                        pf.skip_header(separated_file)
-                        generation = 0
-                        for line in separated_file:
-                            split_line = pf.get_split_line(line, separator)
-                            result = self._parse_pool(split_line, generation)
-                            # print "Value read: ", result
-                            if len(results) < (generation + 1):
-                                results.append(result)
-                            else:
-                                for i in range(len(result)):
-                                    old_value = results[generation][i]
-                                    new_value = result[i]
-                                    if new_value > old_value:
-                                        results[generation][i] = new_value
-                            generation += 1
-                generation = 0
-                for result in results:
-                    for plot_id, value in zip(to_plot, result):
-                        # print "Value used:", value
-                        self.raw_data.add(plot_id, generation, value)
-                    generation += 1
+                runs = [pf.select_columns(data, to_plot, file_name)
+                        for file_name, data in zip(file_names, pf.collect_arrays(arrays))]
+                pooled = pool_runs(runs, pool_reducer, len(to_plot))
+                self.raw_data.add_runs(to_plot, np.arange(len(pooled)), pooled[np.newaxis])
 
         else:
-            for file_name in self.treatment.files:
-                with open(file_name, 'r') as separated_file:
-                    print("Reading raw data from " + file_name + "...")
-                    pf.skip_header(separated_file)
-                    generation = 0
-                    for line in separated_file:
-                        # split_line_temp = line.split(separator)
-                        split_line = pf.get_split_line(line, separator)
-                        self._add(split_line, generation)
-                        generation += 1
+            line_filter = self.get_line_filter(options)
+            generations, data = pf.read_runs(self.treatment.files, to_plot,
+                                             arrays=pf.collect_arrays(pending[0]),
+                                             line_filter=line_filter, options=options)
+            self.raw_data.add_runs(to_plot, generations, data)
+            self.raw_data.line_filter = line_filter
+
+    def combine_part(self, index, file_names, arrays, options=None):
+        """
+        Combines the arrays read from the files of one directory, in
+        one_value_per_dir mode, into the generations and values of that
+        directory, and writes them to the cache of that directory.
+
+        :return: A tuple (generations, values).
+        """
+        # Read global data
+        if options is None:
+            options = go.get_snapshot()
+        to_plot = options.get_int_list("to_plot")
+        x_from_file = options.get_bool("x_from_file")
+
+        generations = [np.zeros(0, dtype=np.int64)]
+        values = [np.zeros((0, len(to_plot)))]
+        for file_name, data in zip(file_names, pf.collect_arrays(arrays)):
+            print("Reading raw data for value " + str(index) + " from " + file_name + "...")
+            line_nrs = np.full(data.shape[0], index)
+            generations.append(pf.get_generations(data, line_nrs, options))
+            values.append(pf.select_columns(data, to_plot, file_name))
+        generations = np.concatenate(generations)
+        values = np.concatenate(values)
+        self.write_part_cache(file_names, generations if x_from_file else None, values, options)
+        return generations, values
+
+    def get_part_cache_file_name(self, file_names):
+        return cm.get_cache_manager().get_path(self.treatment.get_part_cache_file_name(file_names))
+
+    def get_part_fingerprint(self, file_names):
+        """
+        Returns a hash of the files of one directory, in one_value_per_dir
+        mode, and of everything else the values read from them depend on.
+        The position of the directory is not part of it, such that inserting
+        a directory leaves the caches of the directories after it valid.
+        """
+        strings = []
+        for file, size, mtime_ns in tl.get_file_manifest(file_names):
+            strings += [file, str(size), str(mtime_ns)]
+        strings += tl.get_options_fingerprint(["separator", "x_from_file", "x_column", "to_plot"])
+        return tl.hash_list_of_strings(strings)[:16]
+
+    def read_part_cache(self, index, file_names, options=None):
+        """
+        Reads the generations and values of one directory, in
+        one_value_per_dir mode, from its cache. Unless they are read from
+        the files, the generations are derived from the provided index.
+
+        :return: A tuple (generations, values), or None if the cache is
+          missing or outdated.
+        """
+        # Read global data
+        if options is None:
+            options = go.get_snapshot()
+        read_cache = options.get_bool("read_cache") and options.get_bool("read_data_cache")
+        x_from_file = options.get_bool("x_from_file")
+
+        if not read_cache or not cm.get_cache_manager().cache_dir or len(file_names) == 0:
+            return None
+        cache_file_name = self.get_part_cache_file_name(file_names)
+        try:
+            header, part = cf.read_array_cache(cache_file_name)
+        except IOError:
+            return None
+        except CacheError:
+            return None
+        if header.get("fingerprint") != self.get_part_fingerprint(file_names):
+            return None
+        debug_print("files", "Reading values for value", index, "from cache:", cache_file_name)
+        cm.get_cache_manager().touch(cache_file_name)
+        part = np.array(part)
+        if x_from_file:
+            return part[:, 0].astype(np.int64), part[:, 1:]
+        return pf.get_generations(part, np.full(part.shape[0], index), options), part
+
+    def write_part_cache(self, file_names, generations, values, options=None):
+        """
+        Writes the values of one directory, in one_value_per_dir mode, to its
+        cache, preceded by their generations if these were read from the
+        files (i.e. are not None).
+        """
+        # Read global data
+        if options is None:
+            options = go.get_snapshot()
+        write_cache = options.get_bool("write_cache") and options.get_bool("write_data_cache")
 
-    def init_stats(self, plot_id, stats):
+        if not write_cache or not cm.get_cache_manager().cache_dir:
+            return
+        cache_file_name = self.get_part_cache_file_name(file_names)
+        if generations is not None:
+            values = np.column_stack([generations, values])
+        cf.write_array_cache(cache_file_name, values,
+                             fingerprint=self.get_part_fingerprint(file_names))
+        cm.get_cache_manager().add(cache_file_name)
+
+    def init_stats(self, plot_id, stats, executor=None):
+        options = go.get_snapshot()
+        pending = self.start_stats(plot_id, stats, executor, options)
+        if pending is not None:
+            self.finish_stats(pending, options)
+        assert plot_id in self.stats
+        assert stats in self.stats[plot_id]
+
+    def start_stats(self, plot_id, stats, executor=None, options=None):
+        """
+        Reads the requested statistics from cache or, if that fails, submits
+        their calculation to the provided executor.
+
+        If another process is already calculating the same statistics, the
+        returned calculation instead waits for, and reads, the cache written
+        by that process.
+
+        :return: The pending calculation to pass to finish_stats, or None if
+          the statistics are already available.
+        """
+        if self.try_init_stats_from_cache(plot_id, stats):
+            return None
+        if not self.lock_stats_cache(plot_id, stats, blocking=False):
+            return plot_id, stats, None, None
+        try:
+            pending = self.start_stats_from_data(plot_id, stats, executor, options)
+        except BaseException:
+            self.unlock_stats_cache(plot_id, stats)
+            raise
+        if pending is None:
+            self.unlock_stats_cache(plot_id, stats)
+        return pending
+
+    def try_init_stats_from_cache(self, plot_id, stats):
+        """
+        :return: True if the requested statistics were read from cache.
+        """
         # Get global data
         read_cache = go.get_bool("read_cache") and go.get_bool("read_median_ci_cache")
 
@@ -268,14 +683,37 @@ class DataSingleTreatment:
                 self.init_stats_from_cache(plot_id, stats)
                 assert plot_id in self.stats
                 assert stats in self.stats[plot_id]
-                return
+                return True
             except IOError:
                 pass
             except CacheError:
                 pass
-        self.init_stats_from_data(plot_id, stats)
-        assert plot_id in self.stats
-        assert stats in self.stats[plot_id]
+        return False
+
+    def lock_stats_cache(self, plot_id, stats, blocking=True):
+        """
+        Locks the cache file for the requested statistics, such that
+        concurrent jobs do not calculate the same statistics twice.
+
+        :return: False if another process holds the lock and blocking is
+          False, True otherwise.
+        """
+        # Get global data
+        write_cache = (go.get_bool("write_cache") and
+                       go.get_bool("write_median_ci_cache"))
+
+        if not write_cache:
+            return True
+        lock = cm.CacheLock(self.get_cache_file_name(plot_id, stats))
+        if not lock.acquire(blocking):
+            return False
+        self.cache_locks[(plot_id, stats)] = lock
+        return True
+
+    def unlock_stats_cache(self, plot_id, stats):
+        lock = self.cache_locks.pop((plot_id, stats), None)
+        if lock is not None:
+            lock.release()
 
     def init_median_and_ci(self, plot_id):
         print('WARNING: init_median_and_ci is deprecated')
@@ -293,44 +731,52 @@ class DataSingleTreatment:
         self.init_median_and_ci_from_data(plot_id)
 
     def init_stats_from_cache(self, plot_id, stats):
+        cache_file_name = self.get_cache_file_name(plot_id, stats)
+        median_and_ci = self.read_stats_cache(cache_file_name, stats)
+        if plot_id not in self.stats:
+            self.stats[plot_id] = dict()
+        self.stats[plot_id][stats] = median_and_ci
+
+    def init_median_and_ci_from_cache(self, plot_id):
+        print('WARNING: init_median_and_ci_from_cache is deprecated')
+        cache_file_name = self.get_cache_file_name(plot_id)
+        self.median_and_ci[plot_id] = self.read_stats_cache(cache_file_name)
+
+    def read_stats_cache(self, cache_file_name, stats=None):
+        """
+        Reads a binary stats cache, or a text stats cache written by an older
+        version of this script.
+
+        :return: A MedianAndCI with the cached statistics.
+        """
         # Read global data
         step = go.get_int("step")
         x_from_file = go.get_bool("x_from_file")
 
+        # Fail on missing caches before determining the max generation,
+        # which may require reading the raw data
+        cm.get_cache_manager().touch(cache_file_name)
+        if not cf.is_binary_cache(cache_file_name):
+            return self.read_text_stats_cache(cache_file_name)
+        print("Reading from cache file " + cache_file_name + "...")
+        header, generations, median, ci_min, ci_max = cf.read_stats_cache(cache_file_name)
+
         # Get the max generation for which we have data
         max_generation = self.get_max_generation()
-        generations_to_plot = range(0, max_generation, step)
-        data_points = len(generations_to_plot)
-        cache_file_name = self.treatment.get_cache_file_name(plot_id, stats)
-
-        # Count the number of data points we have in
-        count = pf.get_nr_of_lines(cache_file_name)
-
-        # Read the cache file
-        with open(cache_file_name, 'r') as cache_file:
-            print("Reading from cache file " + cache_file_name + "...")
-            if plot_id not in self.stats:
-                self.stats[plot_id] = dict()
-            self.stats[plot_id][stats] = MedianAndCI()
-            data_point_number = 0
-            for line in cache_file:
-                try:
-                    generation = generations_to_plot[data_point_number]
-                    split_line = line.split()
-                    debug_print("data", "Expected generation:", generation)
-                    debug_print("data", split_line)
-                    if generation != int(split_line[3]) and not x_from_file:
-                        raise CacheError("Step mismatch")
-                    self.stats[plot_id][stats].add(int(split_line[3]),
-                                                   split_line[0],
-                                                   split_line[1],
-                                                   split_line[2])
-                    data_point_number += 1
-                except IndexError:
-                    break
-
-    def init_median_and_ci_from_cache(self, plot_id):
-        print('WARNING: init_median_and_ci_from_cache is deprecated')
+        data_points = len(range(0, max_generation, step))
+        if header.get("step", step) != step:
+            raise CacheError("Step mismatch")
+        if stats is not None and header.get("stats", stats) != stats:
+            raise CacheError("Cache created for different stats")
+        generations = generations[:data_points]
+        if not x_from_file and not np.array_equal(generations, np.arange(len(generations)) * step):
+            raise CacheError("Step mismatch")
+        return MedianAndCI(generations,
+                           median[:data_points],
+                           ci_min[:data_points],
+                           ci_max[:data_points])
+
+    def read_text_stats_cache(self, cache_file_name):
         # Read global data
         step = go.get_int("step")
         x_from_file = go.get_bool("x_from_file")
@@ -338,41 +784,44 @@ class DataSingleTreatment:
         # Get the max generation for which we have data
         max_generation = self.get_max_generation()
         generations_to_plot = range(0, max_generation, step)
-        data_points = len(generations_to_plot)
-        cache_file_name = self.treatment.get_cache_file_name(plot_id)
-
-        # Count the number of data points we have in
-        count = pf.get_nr_of_lines(cache_file_name)
 
         # Read the cache file
         with open(cache_file_name, 'r') as cache_file:
             print("Reading from cache file " + cache_file_name + "...")
-            self.median_and_ci[plot_id] = MedianAndCI()
             data_point_number = 0
+            columns = [], [], [], []
+            debug_data = get_debug_print("data")
             for line in cache_file:
+                if line.startswith("#"):
+                    continue
                 try:
                     generation = generations_to_plot[data_point_number]
                     split_line = line.split()
-                    debug_print("data", "Expected generation:", generation)
-                    debug_print("data", split_line)
+                    debug_data("Expected generation:", generation)
+                    debug_data(split_line)
                     if generation != int(split_line[3]) and not x_from_file:
                         raise CacheError("Step mismatch")
-                    self.median_and_ci[plot_id].add(int(split_line[3]),
-                                                    split_line[0],
-                                                    split_line[1],
-                                                    split_line[2])
+                    columns[0].append(int(split_line[3]))
+                    for i in range(3):
+                        columns[i + 1].append(float(split_line[i]))
                     data_point_number += 1
                 except IndexError:
                     break
+        return MedianAndCI(*columns)
 
     def init_stats_from_data(self, plot_id, stats):
+        pending = self.start_stats_from_data(plot_id, stats)
+        if pending is not None:
+            self.finish_stats(pending)
+
+    def start_stats_from_data(self, plot_id, stats, executor=None, options=None):
         # Read global data
-        step = go.get_int("step")
+        if options is None:
+            options = go.get_snapshot()
+        step = options.get_int("step")
         # stats = getStr('stats')
 
-        write_cache = (go.get_bool("write_cache") and
-                       go.get_bool("write_median_ci_cache"))
-        x_from_file = go.get_bool("x_from_file")
+        x_from_file = options.get_bool("x_from_file")
 
         # Initialize empty median and ci
         if plot_id not in self.stats:
@@ -383,11 +832,15 @@ class DataSingleTreatment:
 
         if plot_id not in self.get_raw_data():
             print("Warning: no data available for plot", plot_id, "skipping.")
-            return
+            return None
+        raw_data = self.get_raw_data()
+        column = raw_data[plot_id]
+        generation_mask = column.get_mask()
+        generations = column.generations[generation_mask]
         if x_from_file:
-            max_generation_available = self.get_raw_data().get_max_generation(plot_id)
+            max_generation_available = generations[-1]
         else:
-            max_generation_available = len(self.get_raw_data()[plot_id])
+            max_generation_available = raw_data.get_nr_of_generations(generations)
         if max_generation_available < max_generation:
             print("Warning: data does not extent until max generation: " +
                   str(max_generation))
@@ -397,24 +850,53 @@ class DataSingleTreatment:
 
         # Calculate median and confidence intervals
         print("Calculating confidence intervals...")
-        y_values = sorted(self.get_raw_data()[plot_id].keys())
-        generations_to_plot = y_values[0:len(y_values):step]
-        debug_print("plot", "generations_to_plot: " + str(generations_to_plot) +
-                    " max generation: " + str(max_generation))
-        for generation in generations_to_plot:
-            raw_data = self.get_raw_data()[plot_id][generation]
-            # if bootstrap:
-            print("Generation: " + str(generation))
-            # print("raw_data:", raw_data)
-            median, ci_min, ci_max = calc_stats(raw_data, stats)
-            # print("median:", median, ci_min, ci_max)
-            debug_print("ci", str(median) + " " +
-                        str(ci_min) + " " + str(ci_max))
-            # else:
-            #     median, ci_min, ci_max = calc_median_and_interquartile_range(raw_data)
-            self.stats[plot_id][stats].add(generation, median, ci_min, ci_max)
-        if write_cache:
-            self.stats_to_cache(stats)
+        stride = raw_data.get_stride(generations, step)
+        generations_to_plot = generations[stride]
+        values_to_plot = column.values[:, generation_mask][:, stride]
+        debug_print("plot", "generations_to_plot:", generations_to_plot,
+                    "max generation:", max_generation)
+        seed_key = (self.treatment.get_id(), plot_id)
+        blocks = submit_stats_blocks(values_to_plot, stats, options.get_int("seed"), seed_key,
+                                     executor, chunk_size=options.get_int("bootstrap_chunk_size"))
+        return plot_id, stats, generations_to_plot, blocks
+
+    def finish_stats(self, pending, options=None):
+        """
+        Waits for a calculation started by start_stats and stores its results.
+        """
+        # Read global data
+        if options is None:
+            options = go.get_snapshot()
+        write_cache = (options.get_bool("write_cache") and
+                       options.get_bool("write_median_ci_cache"))
+
+        plot_id, stats, generations_to_plot, blocks = pending
+        if blocks is None:
+            self.wait_for_stats(plot_id, stats)
+            return
+        try:
+            median, ci_min, ci_max = collect_stats_blocks(blocks)
+            debug_print("ci", "median:", median, "ci_min:", ci_min, "ci_max:", ci_max)
+            self.stats[plot_id][stats].set_arrays(generations_to_plot, median, ci_min, ci_max)
+            if write_cache:
+                self.stats_to_cache(stats)
+        finally:
+            self.unlock_stats_cache(plot_id, stats)
+
+    def wait_for_stats(self, plot_id, stats):
+        """
+        Waits for another process to write the requested statistics to cache,
+        and calculates them here if that process did not succeed.
+        """
+        self.lock_stats_cache(plot_id, stats)
+        if self.try_init_stats_from_cache(plot_id, stats):
+            self.unlock_stats_cache(plot_id, stats)
+            return
+        pending = self.start_stats_from_data(plot_id, stats)
+        if pending is None:
+            self.unlock_stats_cache(plot_id, stats)
+        else:
+            self.finish_stats(pending)
 
     def init_median_and_ci_from_data(self, plot_id):
         print('WARNING: init_median_and_ci_from_data is deprecated')
@@ -452,65 +934,18 @@ class DataSingleTreatment:
 
         # Calculate median and confidence intervals
         print("Calculating confidence intervals...")
-        y_values = sorted(self.get_raw_data()[plot_id].keys())
-        generations_to_plot = y_values[0:len(y_values):step]
-        debug_print("plot", "generations_to_plot: " + str(generations_to_plot) +
-                    " max generation: " + str(max_generation))
-        for generation in generations_to_plot:
-            raw_data = self.get_raw_data()[plot_id][generation]
-            # if bootstrap:
-            print("Generation: " + str(generation))
-            # print("raw_data:", raw_data)
-            median, ci_min, ci_max = calc_stats(raw_data, stats)
-            # print("median:", median, ci_min, ci_max)
-            debug_print("ci", str(median) + " " +
-                        str(ci_min) + " " + str(ci_max))
-            # else:
-            #     median, ci_min, ci_max = calc_median_and_interquartile_range(raw_data)
-            self.median_and_ci[plot_id].add(generation, median, ci_min, ci_max)
+        column = self.get_raw_data()[plot_id]
+        generation_mask = column.get_mask()
+        generations_to_plot = column.generations[generation_mask][::step]
+        values_to_plot = column.values[:, generation_mask][:, ::step]
+        debug_print("plot", "generations_to_plot:", generations_to_plot,
+                    "max generation:", max_generation)
+        chunk_size = go.get_int("bootstrap_chunk_size")
+        median, ci_min, ci_max = calc_stats_array(values_to_plot, stats, chunk_size=chunk_size)
+        self.median_and_ci[plot_id].set_arrays(generations_to_plot, median, ci_min, ci_max)
         if write_cache:
             self.to_cache()
 
-    def _parse_pool(self, split_line, generation):
-        to_plot = go.get_int_list("to_plot")
-        x_values_passed = go.get_exists("x_values")
-        x_values = go.get_int_list("x_values")
-
-        result = []
-        debug_print("read_values", "Split line:", split_line,
-                    "plot requested:", to_plot)
-        for plot_id in to_plot:
-            if len(split_line) <= plot_id:
-                print("Error: no data for requested column" + str(plot_id) +
-                      "in line (length" + str(len(split_line)) + ")" +
-                      split_line)
-            else:
-                result.append(float(split_line[plot_id]))
-        return result
-
-    def _add(self, split_line, generation):
-        to_plot = go.get_int_list("to_plot")
-        x_from_file = go.get_bool("x_from_file")
-        x_column = go.get_int("x_column")
-        x_values_passed = go.get_exists("x_values")
-        x_values = go.get_int_list("x_values")
-
-        debug_print("read_values", "Split line:", split_line,
-                    "plot requested:", to_plot)
-        for plot_id in to_plot:
-            if len(split_line) <= plot_id:
-                print("Error: no data for requested column", plot_id,
-                      "in line (length", len(split_line), ")", split_line)
-            elif x_from_file and len(split_line) > 1:
-                self.raw_data.add(plot_id, int(split_line[x_column]),
-                                  float(split_line[plot_id]))
-            elif x_values_passed and generation < len(x_values):
-                self.raw_data.add(plot_id, x_values[generation],
-                                  float(split_line[plot_id]))
-            else:
-                self.raw_data.add(plot_id, generation,
-                                  float(split_line[plot_id]))
-
 
 class DataOfInterest:
     def __init__(self, treatment_list):
@@ -546,6 +981,87 @@ class DataOfInterest:
             self.init_max_generation()
         return self.max_generation
 
+    def init_stats(self, plot_id, stats):
+        """
+        Calculates the requested statistics for every treatment that does not
+        have them yet, spreading the work over "workers" processes.
+        """
+        # Read global data
+        options = go.get_snapshot()
+        workers = options.get_int("workers")
+
+        executor = None
+        if workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            missing = []
+            for treatment in self.treatment_list:
+                treatment_data = self.get_treatment_data(treatment)
+                if stats in treatment_data.stats.get(plot_id, {}):
+                    continue
+                if not treatment_data.try_init_stats_from_cache(plot_id, stats):
+                    missing.append(treatment_data)
+            self.init_raw_data([treatment_data.treatment for treatment_data in missing], executor,
+                               options)
+            pending = []
+            for treatment_data in missing:
+                pending.append((treatment_data,
+                                treatment_data.start_stats(plot_id, stats, executor, options)))
+            # Finish our own calculations, releasing their locks, before
+            # waiting for other processes, such that no process waits while
+            # holding a lock.
+            pending.sort(key=lambda entry: entry[1] is not None and entry[1][3] is None)
+            for treatment_data, calculation in pending:
+                if calculation is not None:
+                    treatment_data.finish_stats(calculation, options)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def init_raw_data(self, treatments, executor=None, options=None):
+        """
+        Reads the files of all provided treatments whose raw data has not been
+        read yet. The files of all treatments are read by "io_threads"
+        threads at once, and parsed by the provided executor or, if None, by
+        "workers" processes. The results do not depend on the number of
+        threads or processes.
+        """
+        # Read global data
+        if options is None:
+            options = go.get_snapshot()
+        workers = options.get_int("workers")
+        io_threads = options.get_int("io_threads")
+
+        to_read = [self.get_treatment_data(treatment) for treatment in treatments]
+        to_read = [treatment_data for treatment_data in to_read if treatment_data.raw_data is None]
+        if len(to_read) == 0:
+            return
+        parse_executor = executor
+        if parse_executor is None and workers > 1:
+            parse_executor = ProcessPoolExecutor(max_workers=workers)
+        io_executor = None
+        if io_threads > 1:
+            io_executor = ThreadPoolExecutor(max_workers=io_threads)
+        try:
+            pending = [(treatment_data,
+                        treatment_data.start_raw_data(io_executor, parse_executor, options))
+                       for treatment_data in to_read]
+            for treatment_data, reads in pending:
+                treatment_data.finish_raw_data(reads, options)
+        finally:
+            if io_executor is not None:
+                io_executor.shutdown()
+            if parse_executor is not None and parse_executor is not executor:
+                parse_executor.shutdown()
+
+    def get_cache_key(self):
+        """
+        Returns a hash of the cache keys of all treatments, which changes
+        whenever the data or options of any treatment change.
+        """
+        return tl.hash_list_of_strings([treatment.get_cache_key()
+                                        for treatment in self.treatment_list])[:16]
+
     def get_min_generation(self):
         return 0
 
@@ -558,8 +1074,8 @@ class DataOfInterest:
         treatment_data = self.get_treatment_data(treatment)
         med_ci = treatment_data.get_median_and_ci(first_plot)
         if max_generation == MAX_GEN_NOT_PROVIDED or x_from_file:
-            keys = sorted(med_ci.median.keys())
-            return keys[0:len(med_ci.median.keys()):go.get_int("step")]
+            keys = med_ci.get_generations()
+            return keys[0:len(keys):go.get_int("step")]
         else:
             return range(0, len(med_ci.median) * go.get_int("step"), go.get_int("step"))
 
@@ -572,86 +1088,174 @@ class DataOfInterest:
         treatment_data = self.get_treatment_data(treatment)
         med_ci = treatment_data.get_stats(first_plot, stats)
         if max_generation == MAX_GEN_NOT_PROVIDED or x_from_file:
-            return sorted(med_ci.median.keys())
+            return med_ci.get_generations()
         else:
             return range(0, len(med_ci.median) * go.get_int("step"), go.get_int("step"))
 
     def get_comparison(self, treatment_id_1, treatment_id_2, plot_id):
-        if not self.comparison_cache:
+        if self.comparison_cache is None:
             self.init_compare()
         key = (treatment_id_1, treatment_id_2, plot_id)
         if key not in self.comparison_cache:
             print("Error: no comparison entry for values" + str(key))
             print("Cache:", self.comparison_cache)
-            return []
+            return Comparison()
         return self.comparison_cache[key]
 
+    def get_comparison_cache_file_name(self):
+        return cm.get_cache_manager().get_path(go.get_str("comparison_cache"))
+
     def to_cache(self):
         # Read global data
-        cache_file_name = go.get_str("comparison_cache")
+        cache_file_name = self.get_comparison_cache_file_name()
         stat_test_step = go.get_int("stat_test_step")
 
-        with open(cache_file_name, 'w') as cache_file:
+        keys = []
+        lengths = []
+        for key, comparison in self.comparison_cache.items():
+            main_treatment_id, other_treatment_id, plot_id = key
+            keys.append((plot_id, main_treatment_id, other_treatment_id))
+            lengths.append(len(comparison))
+        comparisons = [Comparison()] + list(self.comparison_cache.values())
+        with cm.atomic_open(cache_file_name, 'wb') as cache_file:
             print("Writing " + cache_file_name + "...")
-            for entry in self.comparison_cache.items():
-                key, generations = entry
-                main_treatment_id, other_treatment_id, plot_id = key
-                cache_file.write(str(plot_id) + " ")
-                cache_file.write(str(main_treatment_id) + " ")
-                cache_file.write(str(other_treatment_id) + " ")
-                cache_file.write(str(stat_test_step) + " ")
-                for generation in generations:
-                    cache_file.write(str(generation) + " ")
-                cache_file.write("\n")
+            np.savez(cache_file,
+                     cache_key=self.get_cache_key(),
+                     stat_test_step=stat_test_step,
+                     max_generation=self.get_available_max_generation(),
+                     keys=np.array(keys, dtype=np.int64).reshape(-1, 3),
+                     offsets=np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]),
+                     generations=np.concatenate([c.generations for c in comparisons]),
+                     statistics=np.concatenate([c.statistics for c in comparisons]),
+                     p_values=np.concatenate([c.p_values for c in comparisons]))
+        cm.get_cache_manager().add(cache_file_name)
 
     def init_max_generation(self):
         # Read global data
         self.max_generation = go.get_int("max_generation")
 
-        # Calculate max generation if necessary
+        # Calculate max generation if necessary, preferring cache headers
+        # over the raw data
         if self.max_generation == MAX_GEN_NOT_PROVIDED:
+            cached = [self.get_treatment_data(treatment).get_cached_max_generation()
+                      for treatment in self.treatment_list]
+            if None not in cached:
+                self.max_generation = max(cached)
+                return
+            cached_max_generation = self.get_cached_max_generation()
+            if cached_max_generation is not None:
+                self.max_generation = cached_max_generation
+                return
+            self.init_raw_data([treatment for treatment, max_generation
+                                in zip(self.treatment_list, cached) if max_generation is None])
             for treatment in self.treatment_list:
                 treatment_data = self.get_treatment_data(treatment)
                 if treatment_data.get_max_generation() > self.max_generation:
                     self.max_generation = treatment_data.get_max_generation()
 
+    def get_available_max_generation(self):
+        """
+        Returns the largest generation for which any treatment has data,
+        regardless of the max_generation option. This is the max generation
+        recorded in the stats caches and the comparison cache.
+        """
+        max_generation = MAX_GEN_NOT_PROVIDED
+        for treatment in self.treatment_list:
+            raw_data = self.get_treatment_data(treatment).get_raw_data()
+            max_generation = max(max_generation, raw_data.get_available_max_generation())
+        return max_generation
+
+    def get_cached_max_generation(self):
+        """
+        Returns the max generation recorded in the comparison cache, or None
+        if no such cache is available.
+        """
+        # Read global data
+        read_cache = (go.get_bool("read_cache") and go.get_bool("read_comparison_cache") and
+                      go.get_bool("sig"))
+        comp_cache_name = self.get_comparison_cache_file_name()
+
+        if not read_cache:
+            return None
+        try:
+            with np.load(comp_cache_name) as cache:
+                cache_key = str(cache["cache_key"])
+                max_generation = int(cache["max_generation"])
+        except (IOError, ValueError, KeyError, EOFError):
+            return None
+        # The cache is named after the config file, so it may have been
+        # written for other data
+        if cache_key != self.get_cache_key():
+            return None
+        # Treatments without any data do not have a max generation
+        if max_generation == MAX_GEN_NOT_PROVIDED:
+            return None
+        return max_generation
+
     def init_compare(self):
+        # Read global data
+        write_cache = (go.get_bool("write_cache") and
+                       go.get_bool("write_comparison_cache"))
+
+        if self.try_init_compare_from_cache():
+            return
+        if not write_cache:
+            self.init_compare_from_data()
+            return
+        # Only one process performs the comparisons, others wait for its cache
+        with cm.CacheLock(self.get_comparison_cache_file_name()):
+            if not self.try_init_compare_from_cache():
+                self.init_compare_from_data()
+
+    def try_init_compare_from_cache(self):
+        """
+        :return: True if the comparisons were read from cache.
+        """
         # Read global data
         read_cache = go.get_bool("read_cache") and go.get_bool("read_comparison_cache")
 
-        self.comparison_cache = DictOfLists()
+        self.comparison_cache = dict()
         if read_cache:
             try:
                 self.init_compare_from_cache()
-                return
+                return True
             except IOError:
                 pass
             except CacheError:
                 pass
-        self.init_compare_from_data()
+        self.comparison_cache = dict()
+        return False
 
     def init_compare_from_cache(self):
         # Read global data
-        comp_cache_name = go.get_str("comparison_cache")
+        comp_cache_name = self.get_comparison_cache_file_name()
         stat_test_step = go.get_int("stat_test_step")
 
         # Actually read the cache file
-        with open(comp_cache_name, 'r') as cache_file:
-            print("Reading from comparison cache " + comp_cache_name + "...")
-            for line in cache_file:
-                numbers = line.split()
-                if len(numbers) < 4:
-                    raise CacheError("Entry is to short.")
-                plot_id_cache = int(numbers[0])
-                main_treat_id_cache = int(numbers[1])
-                other_treat_id_cache = int(numbers[2])
-                stat_test_step_cache = int(numbers[3])
-                if stat_test_step != stat_test_step_cache:
-                    raise CacheError("Cache created with different step")
-                key = (main_treat_id_cache, other_treat_id_cache, plot_id_cache)
-                self.comparison_cache.init_key(key)
-                for i in range(4, len(numbers)):
-                    self.comparison_cache.add(key, int(numbers[i]))
+        print("Reading from comparison cache " + comp_cache_name + "...")
+        cm.get_cache_manager().touch(comp_cache_name)
+        try:
+            with np.load(comp_cache_name) as cache:
+                cache_key = str(cache["cache_key"])
+                stat_test_step_cache = int(cache["stat_test_step"])
+                keys = cache["keys"]
+                offsets = cache["offsets"]
+                generations = cache["generations"].astype(np.int64)
+                statistics = cache["statistics"]
+                p_values = cache["p_values"]
+        except (ValueError, KeyError, EOFError):
+            # Caches written by older versions only hold significant generations
+            raise CacheError("Cache is not a comparison cache with p-values.")
+        if stat_test_step != stat_test_step_cache:
+            raise CacheError("Cache created with different step")
+        if cache_key != self.get_cache_key():
+            raise CacheError("Cache created from different data")
+        for i, (plot_id_cache, main_treat_id_cache, other_treat_id_cache) in enumerate(keys.tolist()):
+            key = (main_treat_id_cache, other_treat_id_cache, plot_id_cache)
+            entries = slice(offsets[i], offsets[i + 1])
+            self.comparison_cache[key] = Comparison(generations[entries],
+                                                    statistics[entries],
+                                                    p_values[entries])
         self.verify_cache()
 
     def verify_cache(self):
@@ -672,6 +1276,8 @@ class DataOfInterest:
         write_cache = (go.get_bool("write_cache") and
                        go.get_bool("write_comparison_cache"))
 
+        self.init_raw_data(self.treatment_list)
+
         # Compare data for all plots and all treatments
         for plot_id in plot_ids:
             for compare_i in go.get_indices("comparison_main"):
@@ -687,7 +1293,6 @@ class DataOfInterest:
 
         # Retrieve data
         stat_test_step = go.get_int("stat_test_step")
-        p_threshold = go.get_float("p_threshold")
         main_treat = self.treatment_list[main_treat_i]
         main_data = self.get_treatment_data(main_treat).get_raw_data()
         other_treat = self.treatment_list[other_treat_i]
@@ -702,32 +1307,83 @@ class DataOfInterest:
             return
         warn_max_gen(self, main_data, other_data, plot_id)
 
-        # Construct a key and add it to the cache
-        key = (main_treat_i, other_treat_i, plot_id)
-        self.comparison_cache.init_key(key)
-
         # Gather all generations for which we have data for both treatments
-        main_gen = set(main_data[plot_id].keys())
-        other_gen = set(other_data[plot_id].keys())
-        generations = list(main_gen.intersection(other_gen))
-        generations.sort()
+        main_column = main_data[plot_id]
+        other_column = other_data[plot_id]
+        main_gen = main_column.generations[main_column.get_mask()]
+        other_gen = other_column.generations[other_column.get_mask()]
+        generations = np.intersect1d(main_gen, other_gen)
+        generations = generations[main_data.get_stride(generations, stat_test_step)]
+        main_values = main_column.values[:, np.searchsorted(main_column.generations, generations)]
+        other_values = other_column.values[:, np.searchsorted(other_column.generations, generations)]
 
         # Perform the actual statistical test
-        for generation in generations[::stat_test_step]:
-            data1 = main_data[plot_id][generation]
-            data2 = other_data[plot_id][generation]
-            p_value = mann_whitney_u(data1, data2)
-            print("Generation:", generation,
-                  "p-value:", p_value,
-                  "mean 1:", np.mean(data1),
-                  "mean 2:", np.mean(data2))
-            if p_value < p_threshold:
-                self.comparison_cache.add(key, generation)
+        statistics, p_values = mann_whitney_u_array(main_values, other_values)
+        debug_print("cache", "Generations:", generations, "p-values:", p_values)
+        print("Compared", len(generations), "generations")
+
+        # Add the results to the cache
+        key = (main_treat_i, other_treat_i, plot_id)
+        self.comparison_cache[key] = Comparison(generations, statistics, p_values)
 
 
 ######################
 ## HELPER FUNCTIONS ##
 ######################
+def _pool_best_so_far(stacked):
+    return np.fmax.accumulate(np.fmax.reduce(stacked, axis=0), axis=0)
+
+
+# Functions reducing a (files x generations x columns) array, padded with NaN,
+# to a single (generations x columns) array, ignoring missing (NaN) values.
+POOL_REDUCERS = {
+    "max": lambda stacked: np.fmax.reduce(stacked, axis=0),
+    "min": lambda stacked: np.fmin.reduce(stacked, axis=0),
+    "mean": lambda stacked: np.nanmean(stacked, axis=0),
+    "median": lambda stacked: np.nanmedian(stacked, axis=0),
+    "best_so_far": _pool_best_so_far,
+}
+
+
+def pool_runs(runs, reducer="max", nr_of_columns=0):
+    """
+    Pools (generations x columns) arrays into a single array with the
+    provided reducer (see POOL_REDUCERS). Generations are matched by line,
+    and the result is as long as the longest array.
+    """
+    if reducer not in POOL_REDUCERS:
+        raise Exception("Invalid option for 'pool_reducer': " + str(reducer))
+    if len(runs) == 0:
+        return np.zeros((0, nr_of_columns))
+    stacked = np.full((len(runs), max(len(run) for run in runs), runs[0].shape[1]), np.nan)
+    for i, run in enumerate(runs):
+        stacked[i, :len(run)] = run
+    with warnings.catch_warnings():
+        # Generations without any values are pooled to NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return POOL_REDUCERS[reducer](stacked)
+
+
+def read_cache_header(cache_file_name):
+    """
+    Reads the header of a binary stats cache, or the "# key value" lines at
+    the start of a text stats cache.
+
+    :return: A dictionary mapping every key to its (string) value.
+    """
+    if cf.is_binary_cache(cache_file_name):
+        return cf.read_header(cache_file_name)
+    header = dict()
+    with open(cache_file_name, 'r') as cache_file:
+        for line in cache_file:
+            if not line.startswith("#"):
+                break
+            split_line = line[1:].split()
+            if len(split_line) == 2:
+                header[split_line[0]] = split_line[1]
+    return header
+
+
 def warn_data_avail(plot_id, treatment):
     print("Warning: no data available for plot", plot_id,
           "treatment", treatment.get_name(), ", skipping...")
@@ -822,6 +1478,7 @@ def create_plots(data_of_interest):
 
 
 def draw_plot(index, data_of_interest, ax, stats):
+    data_of_interest.init_stats(go.get_int("to_plot", index), stats)
     for treatment in data_of_interest.get_treatment_list():
         plot_treatment(index, treatment, data_of_interest, ax, stats)
 
@@ -993,6 +1650,7 @@ def add_significance_bar(plot_config, data_intr, bar_nr):
     main_treat = data_intr.get_treatment_list()[main_treat_i]
     other_treats = get_other_treatments(bar_nr, data_intr)
     plot_id = go.get_int("to_plot", i)
+    p_threshold = go.get_float("p_threshold")
     box_top = len(other_treats) * ROW_HEIGHT
     box_bot = 0
 
@@ -1077,7 +1735,7 @@ def add_significance_bar(plot_config, data_intr, bar_nr):
                 solid_capstyle="projecting")
 
         comp = data_intr.get_comparison(main_treat_i, other_treat_i, plot_id)
-        for index in comp:
+        for index in comp.get_significant(p_threshold):
             ax.scatter(index,
                        row_center,
                        marker=sig_marker,
@@ -1213,6 +1871,9 @@ def parse_options(command_line_args):
 
     data_intr = DataOfInterest(treatment_list)
 
+    if not go.get_exists("seed"):
+        go.set_glb("seed", [np.random.SeedSequence().entropy])
+
     if not go.get_exists("marker_step"):
         go.set_glb("marker_step", [int(data_intr.get_max_generation() / 10)])
 
@@ -1223,6 +1884,10 @@ def add_options():
     tl.add_options()
     pf.add_options()
     cp.add_options()
+    cm.add_options()
+    tl.add_cache_key_options("templates", "pool", "pool_reducer", "separator", "x_from_file",
+                             "x_column", "x_values", "one_value_per_dir", "step",
+                             "max_generation")
 
     # General plot settings
     go.add_option("max_generation", MAX_GEN_NOT_PROVIDED, nargs=1,
@@ -1246,11 +1911,23 @@ def add_options():
                            "bootstrap_pi, bootstrap_abc. Percentile and takes the "
                            "percentile of the sampled data (biased). Pivotal also subtracts "
                            "difference between the sampled and the original distribution "
-                           "(unbiased, but may be wrong for certain distributions). Pi is "
-                           "the scikits implementation of the percentile method. Bca is a "
-                           "faster, bias-correct bootstrap method. Abc is a parametric method "
-                           "meaning its faster, but it requires a smooth function to be "
-                           "available.")
+                           "(unbiased, but may be wrong for certain distributions). Bca is a "
+                           "bias-corrected and accelerated bootstrap method. Pi and abc are "
+                           "accepted for backwards compatibility, and are calculated with the "
+                           "bca method.")
+    go.add_option("bootstrap_chunk_size", BOOTSTRAP_CHUNK_SIZE, nargs=1,
+                  help_str="Maximum size, in megabytes, of the array of resampled data "
+                           "created while bootstrapping. Generations are bootstrapped in "
+                           "batches small enough to stay below this size.")
+    go.add_option("workers", 1, nargs=1,
+                  help_str="Number of processes used to parse input files and calculate "
+                           "statistics.")
+    go.add_option("io_threads", 8, nargs=1,
+                  help_str="Number of threads used to read input files.")
+    go.add_option("seed", nargs=1,
+                  help_str="Root seed for the random streams used for bootstrapping. Results "
+                           "are reproducible for a given seed, regardless of the number of "
+                           "workers. If not provided, a random seed is used.")
     go.add_option("smoothing", 1, nargs=1,
                   help_str="Applies a median window of the provided size to smooth the "
                            "line plot.")
@@ -1264,6 +1941,10 @@ def add_options():
     go.add_option("one_value_per_dir", False, nargs=1,
                   help_str="If true, assumes that every file found holds a single value, "
                            "to be plotted sequentially.")
+    go.add_option("pool_reducer", "max", nargs=1,
+                  help_str="How the files in a pooled directory are combined at each "
+                           "generation. Options: max, min, mean, median, and best_so_far, "
+                           "which is the highest maximum up to that generation.")
 
     # General inset settings
     go.add_option('inset_stats', '', nargs=1,
@@ -1385,6 +2066,12 @@ def add_options():
                   help_str="If false, script will not write statistical results to cache.")
     go.add_option("comparison_cache", def_comp_cache, nargs=1,
                   help_str="Name of the cache file that holds statistical results.")
+    go.add_option("read_data_cache", True, nargs=1,
+                  help_str="If false, script will not read parsed input files from cache. "
+                           "Parsed input files are only cached when cache_dir is set.")
+    go.add_option("write_data_cache", True, nargs=1,
+                  help_str="If false, script will not write parsed input files to cache. "
+                           "Parsed input files are only cached when cache_dir is set.")
 
     # Per treatment settings
     go.add_option("sig_marker", def_sig_marker,
@@ -2,6 +2,7 @@ __author__ = 'Joost Huizinga'
 __version__ = '1.8 (Jun. 27 2019)'
 
 import sys
+import copy
 import shlex
 from typing import List, Any, Dict, Union, Callable, Optional
 import argparse as ap
@@ -14,6 +15,8 @@ from createPlotUtils import debug_enabled, debug_print, InputError
 global_options: Dict[str, Union[List[Any], Callable]] = {}
 global_alias = {}
 global_parser = ap.ArgumentParser()
+# Snapshot of global_options, see get_snapshot
+global_snapshot = None
 
 RETURN_NONE = 1
 RETURN_FIRST = 2
@@ -73,7 +76,7 @@ def add_option(name, value=NotProvided, nargs='+', aliases=None, help_str=""):
     if not isinstance(value, list) and not hasattr(value, '__call__'):
         value = [value]
     global_parser.add_argument("--" + name, type=str, nargs=nargs, help=help_str)
-    global_options[name] = value
+    set_glb(name, value)
     if aliases is not None:
         for alias in aliases:
             global_alias[alias] = name
@@ -85,7 +88,7 @@ def add_positional_option(name, value=NotProvided, nargs='+', help_str=""):
     if not isinstance(value, list) and not hasattr(value, '__call__'):
         value = [value]
     global_parser.add_argument(name, type=str, nargs=nargs, help=help_str)
-    global_options[name] = value
+    set_glb(name, value)
 
 
 def set_glb(name: str, value: Union[List[Any], Callable]):
@@ -96,7 +99,9 @@ def set_glb(name: str, value: Union[List[Any], Callable]):
     :param name: Name of the option.
     :param value: Value for the option
     """
+    global global_snapshot
     global_options[name] = value
+    global_snapshot = None
 
 
 def get_glb(name: str) -> Union[List[Any], Callable]:
@@ -122,21 +127,47 @@ def get_any(name: str, index: int = 0, default: Any = None, when_not_exist: int
       out of range for the option.
     :return: Value of the option with the provided name at the provided index.
     """
-    if not get_exists(name, index):
+    return _get_any(global_options, name, index, default, when_not_exist)
+
+
+def _get_any(options, name, index, default, when_not_exist):
+    """
+    Implements get_any for the provided dictionary of options, such that the
+    module and OptionSnapshot resolve values in the same way.
+    """
+    if index >= len(options[name]):
         if when_not_exist == RETURN_DEFAULT:
             return default
         elif when_not_exist == RETURN_FIRST:
-            return get_any(name, 0, default)
+            return _get_any(options, name, 0, default, RETURN_DEFAULT)
         elif when_not_exist == RETURN_NONE:
             return None
         elif when_not_exist == RETURN_INDEX:
             return index
         elif when_not_exist == RAISE_EXCEPTION:
             raise IndexError(f"Index {index} out of range for option {name} "
-                             f"with {len(global_options[name])} values.")
+                             f"with {len(options[name])} values.")
         else:
             raise ValueError(f"{when_not_exist} is not a valid strategy.")
-    return global_options[name][index]
+    return options[name][index]
+
+
+def _get_value(options, cast, as_list, name, index, default, when_not_exist):
+    """
+    Returns the value of an option as the getters of this module do: cast
+    with "cast" (if not None), and wrapped in a list if "as_list" is True.
+    """
+    value = _get_any(options, name, index, default, when_not_exist)
+    if as_list:
+        if not isinstance(value, list) and value is not None:
+            value = [value]
+        if cast is not None:
+            value = safe_cast_list(cast, value)
+    elif cast is not None:
+        value = safe_cast(cast, value)
+        if cast is str and index >= len(options[name]) and when_not_exist == RETURN_INDEX:
+            value = "undefined-" + value
+    return value
 
 
 def get_str(
@@ -145,10 +176,7 @@ def get_str(
         default: Optional[str] = None,
         when_not_exist: int = RETURN_DEFAULT
 ) -> Optional[str]:
-    value = safe_cast(str, get_any(name, index, default, when_not_exist))
-    if not get_exists(name, index) and when_not_exist == RETURN_INDEX:
-        value = "undefined-" + value
-    return value
+    return _get_value(global_options, str, False, name, index, default, when_not_exist)
 
 
 def get_bool(
@@ -157,7 +185,7 @@ def get_bool(
         default: Optional[bool] = False,
         when_not_exist: int = RETURN_DEFAULT
 ) -> Optional[bool]:
-    return safe_cast(custom_cast_to_bool, get_any(name, index, default, when_not_exist))
+    return _get_value(global_options, custom_cast_to_bool, False, name, index, default, when_not_exist)
 
 
 def get_int(
@@ -166,7 +194,7 @@ def get_int(
         default: Optional[int] = 0,
         when_not_exist: int = RETURN_DEFAULT
 ) -> Optional[int]:
-    return safe_cast(int, get_any(name, index, default, when_not_exist))
+    return _get_value(global_options, int, False, name, index, default, when_not_exist)
 
 
 def get_float(
@@ -175,7 +203,7 @@ def get_float(
         default: Optional[float] = 0,
         when_not_exist: int = RETURN_DEFAULT
 ) -> Optional[float]:
-    return safe_cast(float, get_any(name, index, default, when_not_exist))
+    return _get_value(global_options, float, False, name, index, default, when_not_exist)
 
 
 def get_list(
@@ -184,10 +212,7 @@ def get_list(
         default: Optional[List] = None,
         when_not_exist: int = RETURN_DEFAULT
 ) -> Optional[List]:
-    value = get_any(name, index, default, when_not_exist)
-    if not isinstance(value, list) and value is not None:
-        value = [value]
-    return value
+    return _get_value(global_options, None, True, name, index, default, when_not_exist)
 
 
 def get_float_list(
@@ -196,7 +221,7 @@ def get_float_list(
         default: Optional[List[float]] = None,
         when_not_exist: int = RETURN_DEFAULT
 ) -> Optional[List[float]]:
-    return safe_cast_list(float, get_list(name, index, default, when_not_exist))
+    return _get_value(global_options, float, True, name, index, default, when_not_exist)
 
 
 def get_int_list(
@@ -205,7 +230,7 @@ def get_int_list(
         default: Optional[List[int]] = None,
         when_not_exist: int = RETURN_DEFAULT
 ) -> Optional[List[int]]:
-    return safe_cast_list(int, get_list(name, index, default, when_not_exist))
+    return _get_value(global_options, int, True, name, index, default, when_not_exist)
 
 
 def get_bool_list(
@@ -214,7 +239,7 @@ def get_bool_list(
         default: Optional[List[bool]] = None,
         when_not_exist: int = RETURN_DEFAULT
 ) -> Optional[List[bool]]:
-    return safe_cast_list(custom_cast_to_bool, get_list(name, index, default, when_not_exist))
+    return _get_value(global_options, custom_cast_to_bool, True, name, index, default, when_not_exist)
 
 
 def get_str_list(
@@ -223,7 +248,7 @@ def get_str_list(
         default: Optional[List[str]] = None,
         when_not_exist: int = RETURN_DEFAULT
 ) -> Optional[List[str]]:
-    return safe_cast_list(str, get_list(name, index, default, when_not_exist))
+    return _get_value(global_options, str, True, name, index, default, when_not_exist)
 
 
 def get_exists(name, index=0):
@@ -235,7 +260,8 @@ def get_indices(name):
 
 
 def read_config(config_file_name):
-    global global_options
+    global global_options, global_snapshot
+    global_snapshot = None
     default_overwritten = {}
     with open(config_file_name, 'r') as config_file:
         for line in config_file:
@@ -305,3 +331,102 @@ def parse_global_options(command_line_args):
             if not isinstance(value, list):
                 value = [value]
             set_glb(key, value)
+
+    return get_snapshot()
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+class OptionSnapshot:
+    """
+    Immutable copy of the options, with the same getters as this module.
+    Every combination of arguments is only resolved and cast once.
+
+    Take a snapshot with get_snapshot once the options have been parsed, and
+    pass it to code that reads many files. Reading an option still builds a
+    key and copies list values, so code that handles every line or value
+    should read its options into locals once per file.
+    """
+    def __init__(self, options: Dict[str, Union[List[Any], Callable]]):
+        object.__setattr__(self, "_options", copy.deepcopy(options))
+        object.__setattr__(self, "_cache", dict())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Option snapshots are immutable")
+
+    def get_exists(self, name, index=0):
+        return index < len(self._options[name])
+
+    def get_indices(self, name):
+        return list(range(len(self._options[name])))
+
+    def _get(self, cast, as_list, name, index, default, when_not_exist):
+        key = (cast, as_list, name, index, _freeze(default), when_not_exist)
+        try:
+            value = self._cache[key]
+        except KeyError:
+            value = _freeze(_get_value(self._options, cast, as_list, name, index, default,
+                                       when_not_exist))
+            self._cache[key] = value
+        return _thaw(value)
+
+    def get_any(self, name: str, index: int = 0, default: Any = None,
+                when_not_exist: int = RETURN_DEFAULT) -> Any:
+        return self._get(None, False, name, index, default, when_not_exist)
+
+    def get_str(self, name: str, index: int = 0, default: Optional[str] = None,
+                when_not_exist: int = RETURN_DEFAULT) -> Optional[str]:
+        return self._get(str, False, name, index, default, when_not_exist)
+
+    def get_bool(self, name: str, index: int = 0, default: Optional[bool] = False,
+                 when_not_exist: int = RETURN_DEFAULT) -> Optional[bool]:
+        return self._get(custom_cast_to_bool, False, name, index, default, when_not_exist)
+
+    def get_int(self, name: str, index: int = 0, default: Optional[int] = 0,
+                when_not_exist: int = RETURN_DEFAULT) -> Optional[int]:
+        return self._get(int, False, name, index, default, when_not_exist)
+
+    def get_float(self, name: str, index: int = 0, default: Optional[float] = 0,
+                  when_not_exist: int = RETURN_DEFAULT) -> Optional[float]:
+        return self._get(float, False, name, index, default, when_not_exist)
+
+    def get_list(self, name: str, index: int = 0, default: Optional[List] = None,
+                 when_not_exist: int = RETURN_DEFAULT) -> Optional[List]:
+        return self._get(None, True, name, index, default, when_not_exist)
+
+    def get_float_list(self, name: str, index: int = 0, default: Optional[List[float]] = None,
+                       when_not_exist: int = RETURN_DEFAULT) -> Optional[List[float]]:
+        return self._get(float, True, name, index, default, when_not_exist)
+
+    def get_int_list(self, name: str, index: int = 0, default: Optional[List[int]] = None,
+                     when_not_exist: int = RETURN_DEFAULT) -> Optional[List[int]]:
+        return self._get(int, True, name, index, default, when_not_exist)
+
+    def get_bool_list(self, name: str, index: int = 0, default: Optional[List[bool]] = None,
+                      when_not_exist: int = RETURN_DEFAULT) -> Optional[List[bool]]:
+        return self._get(custom_cast_to_bool, True, name, index, default, when_not_exist)
+
+    def get_str_list(self, name: str, index: int = 0, default: Optional[List[str]] = None,
+                     when_not_exist: int = RETURN_DEFAULT) -> Optional[List[str]]:
+        return self._get(str, True, name, index, default, when_not_exist)
+
+
+def get_snapshot() -> OptionSnapshot:
+    """
+    Returns an immutable snapshot of the current options. The same snapshot
+    is returned until any option changes.
+    """
+    global global_snapshot
+    if global_snapshot is None:
+        global_snapshot = OptionSnapshot(global_options)
+    return global_snapshot
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import sys
+import treatment_list as tl
+import parse_file as pf
+import global_options as go
+import createPlots
+
+__version__ = "1.0 (Oct. 16 2026)"
+
+
+def ingest_treatment(treatment):
+    """
+    Converts every file of the provided treatment that has not been ingested
+    yet, or that changed since it was ingested.
+
+    :return: The number of files converted.
+    """
+    converted = 0
+    for file_name in treatment.files:
+        # Sidecars cannot be added to archives
+        if pf.split_archive_path(file_name) is not None:
+            continue
+        if pf.read_sidecar(file_name) is not None:
+            continue
+        print("Ingesting " + file_name + "...")
+        pf.write_sidecar(file_name)
+        converted += 1
+    return converted
+
+
+def init_options():
+    go.init_options("Script for converting the data files of each treatment to memory-mapped "
+                    "arrays, which are used by the plotting scripts instead of the original "
+                    "files. Takes the same options and configuration files as createPlots.py.",
+                    "[input [input ...]] [OPTIONS]",
+                    __version__)
+    createPlots.add_options()
+
+
+def execute_ingest(command_line_args):
+    go.parse_global_options(command_line_args)
+    treatment_list = tl.read_treatments()
+    for treatment in treatment_list:
+        converted = ingest_treatment(treatment)
+        print("Treatment " + treatment.get_name() + ": ingested " + str(converted) + " of " +
+              str(len(treatment.files)) + " files.")
+
+
+######################
+#        MAIN        #
+######################
+def main():
+    init_options()
+    execute_ingest(sys.argv[1:])
+
+
+if __name__ == '__main__':
+    main()
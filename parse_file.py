@@ -1,46 +1,345 @@
 import os
+import io
 import re
-from createPlotUtils import debug_print
+import bz2
+import gzip
+import json
+import time
+import lzma
+import tarfile
+import threading
+import zipfile
+import warnings
+import functools
+import posixpath
+import itertools
+import numpy as np
+from concurrent.futures import Future
+from createPlotUtils import CacheError, debug_print
 import global_options as go
+import cache_file as cf
+import cache_manager as cm
 
+try:
+    import zstandard
+except ImportError:
+    # Only needed to read zstd compressed data files
+    zstandard = None
 
-def get_dirs(templates, starting_directory="."):
+# Suffixes of the files written next to every input file by ingestData.py
+SIDECAR_SUFFIX = ".npy"
+SIDECAR_HEADER_SUFFIX = ".json"
+
+# Extensions of the archives that can be used as (part of) a treatment directory
+ARCHIVE_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".zip")
+
+# Directories modified less than this many nanoseconds before they were listed
+# are not remembered by a ScanManifest (see below)
+RACY_NS = 2 * 10**9
+
+# Number of bytes needed to recognize any of the compression formats below
+MAGIC_LENGTH = 6
+
+
+def _require_zstandard(file_name):
+    if zstandard is None:
+        raise IOError("Reading the zstd compressed file " + file_name +
+                      " requires the zstandard package.")
+
+
+def _open_zstd(file_name):
+    _require_zstandard(file_name)
+    return zstandard.open(file_name, 'rt')
+
+
+def _decompress_zstd(data):
+    _require_zstandard("data")
+    return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+
+
+# The magic bytes at the start of a compressed file, with functions to open
+# such a file as text and to decompress its contents in memory.
+COMPRESSIONS = {"gzip": (b"\x1f\x8b", lambda file_name: gzip.open(file_name, 'rt'),
+                         gzip.decompress),
+                "bzip2": (b"BZh", lambda file_name: bz2.open(file_name, 'rt'), bz2.decompress),
+                "xz": (b"\xfd7zXZ\x00", lambda file_name: lzma.open(file_name, 'rt'),
+                       lzma.decompress),
+                "zstd": (b"\x28\xb5\x2f\xfd", _open_zstd, _decompress_zstd)}
+
+
+def get_dirs(templates, starting_directory=".", executor=None, manifest=None):
     current_directories = [starting_directory]
     for template in templates:
+        pattern = re.compile('.*' + template + '.*')
         next_directories = []
-        for directory in current_directories:
-            for filename in os.listdir(directory):
-                next_dir = directory + "/" + filename
-                match_found = re.match('.*' + template + '.*', filename)
-                if os.path.isdir(next_dir) and match_found:
-                    next_directories.append(next_dir)
+        listings = list_directories(current_directories, executor, manifest)
+        for directory, entries in zip(current_directories, listings):
+            for filename, is_dir, _ in entries:
+                if is_dir and pattern.match(filename):
+                    next_directories.append(directory + "/" + filename)
         current_directories = next_directories
     return current_directories
 
 
-def get_files(templates, starting_directory="."):
+def get_files(templates, starting_directory=".", executor=None, manifest=None):
     current_directories = [starting_directory]
     files = []
     for i, template in enumerate(templates):
+        pattern = re.compile(template)
+        last_template = i + 1 == len(templates)
         next_directories = []
-        for directory in current_directories:
-            for filename in os.listdir(directory):
+        listings = list_directories(current_directories, executor, manifest)
+        for directory, entries in zip(current_directories, listings):
+            file_names = set(name for name, _, is_file in entries if is_file)
+            for filename, is_dir, is_file in entries:
+                if not pattern.match(filename):
+                    continue
                 path = directory + "/" + filename
-                match = re.match(template, filename)
-                if os.path.isdir(path) and match:
+                if is_dir:
                     next_directories.append(path)
-                if os.path.isfile(path) and match and i + 1 == len(templates):
+                if is_file and last_template and not _is_sidecar_name(filename, file_names):
                     files.append(path)
         current_directories = next_directories
     debug_print("files", "Template:", templates, "Files found:", files)
     return files
 
 
+def list_directories(directories, executor=None, manifest=None):
+    """
+    Lists the provided directories, in parallel if an executor is provided,
+    and through the provided scan manifest if there is one.
+
+    :return: A list with the result of list_directory for every directory.
+    """
+    list_function = list_directory if manifest is None else manifest.list_directory
+    if executor is None or len(directories) < 2:
+        return [list_function(directory) for directory in directories]
+    return list(executor.map(list_function, directories))
+
+
+def list_directory(directory):
+    """
+    Returns a (name, is_dir, is_file) tuple for every entry of the provided
+    directory. The directory may also be an archive, or a directory inside
+    an archive, in which case the members of the archive are listed.
+    """
+    in_archive = split_archive_path(directory)
+    if in_archive is None:
+        # The file type of most entries is known from the directory listing
+        # itself, so scandir saves a stat per entry.
+        with os.scandir(directory) as entries:
+            return [(entry.name, entry.is_dir(), entry.is_file()) for entry in entries]
+    archive_name, prefix = in_archive
+    if prefix != "":
+        prefix += "/"
+    children = dict()
+    for member in list_archive(archive_name):
+        if member.startswith(prefix):
+            name, separator, _ = member[len(prefix):].partition("/")
+            children[name] = children.get(name, False) or separator != ""
+    return [(name, is_dir, not is_dir) for name, is_dir in sorted(children.items())]
+
+
+class ScanManifest:
+    """
+    Remembers the entries of every directory listed while looking for input
+    files, together with the modification time of that directory. Adding,
+    removing or renaming an entry updates the modification time of its
+    directory, so a directory whose modification time did not change is
+    listed from the manifest, at the cost of a single stat.
+
+    Directories modified less than RACY_NS before they were listed are not
+    remembered, because a later change within the resolution of the file
+    system's timestamps would go unnoticed. Members of archives are listed
+    from the archive itself, which is cached separately.
+    """
+    def __init__(self, file_name=None):
+        self.file_name = file_name
+        self.directories = dict()
+        self.visited = set()
+        self.changed = False
+        self.lock = threading.Lock()
+        if file_name is not None and os.path.isfile(file_name):
+            try:
+                _, self.directories = cf.read_manifest_cache(file_name)
+                debug_print("files", "Read scan manifest", file_name)
+            except (CacheError, ValueError) as e:
+                print("Warning: ignoring scan manifest " + file_name + ": " + str(e))
+
+    def list_directory(self, directory):
+        if split_archive_path(directory) is not None:
+            return list_directory(directory)
+        key = os.path.abspath(directory)
+        mtime_ns = os.stat(directory).st_mtime_ns
+        stored = self.directories.get(key)
+        with self.lock:
+            self.visited.add(key)
+        if stored is not None and stored[0] == mtime_ns:
+            return [tuple(entry) for entry in stored[1]]
+        entries = list_directory(directory)
+        with self.lock:
+            if time.time_ns() - mtime_ns > RACY_NS:
+                self.directories[key] = [mtime_ns, entries]
+            else:
+                self.directories.pop(key, None)
+            self.changed = True
+        return entries
+
+    def write(self):
+        """
+        Writes the manifest if any directory had to be listed, or if
+        directories listed in a previous scan were not visited this time.
+        Only the directories visited during this scan are written.
+
+        :return: True if the manifest was written.
+        """
+        if self.file_name is None:
+            return False
+        if not self.changed and self.visited == set(self.directories):
+            return False
+        directories = dict((key, self.directories[key]) for key in self.visited
+                           if key in self.directories)
+        try:
+            cf.write_manifest_cache(self.file_name, directories)
+        except OSError as e:
+            debug_print("files", "Could not write scan manifest", self.file_name + ":", e)
+            return False
+        debug_print("files", "Wrote scan manifest", self.file_name)
+        return True
+
+
+def is_archive(path):
+    return path.endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(path)
+
+
+def split_archive_path(path):
+    """
+    Splits a path to an archive, or to a file or directory inside an
+    archive (e.g. "treatment.tar.gz/run_1/fitness.dat"), into the path of
+    the archive and the name of the member.
+
+    :return: A tuple (archive_name, member_name), where member_name is ""
+      for the archive itself, or None if the path is not in an archive.
+    """
+    parts = path.split("/")
+    for i in range(1, len(parts) + 1):
+        prefix = "/".join(parts[:i])
+        if is_archive(prefix):
+            return prefix, "/".join(parts[i:])
+    return None
+
+
+def list_archive(archive_name):
+    """
+    Returns the names of all regular files in an archive.
+    """
+    stat = os.stat(archive_name)
+    return _list_archive(archive_name, stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=None)
+def _list_archive(archive_name, size, mtime_ns):
+    # The size and modification time are part of the key, such that a
+    # changed archive is listed again.
+    debug_print("files", "Listing archive:", archive_name)
+    if zipfile.is_zipfile(archive_name):
+        with zipfile.ZipFile(archive_name) as archive:
+            return tuple(posixpath.normpath(info.filename) for info in archive.infolist()
+                         if not info.is_dir())
+    with tarfile.open(archive_name, 'r:*') as archive:
+        return tuple(posixpath.normpath(info.name) for info in archive if info.isfile())
+
+
+def read_archive_members(archive_name, member_names):
+    """
+    Reads the requested members of an archive in a single sequential pass,
+    without extracting them.
+
+    :return: A generator of (member_name, contents) tuples, in the order in
+      which the members are stored in the archive.
+    """
+    member_names = set(member_names)
+    if zipfile.is_zipfile(archive_name):
+        with zipfile.ZipFile(archive_name) as archive:
+            for info in archive.infolist():
+                if posixpath.normpath(info.filename) in member_names:
+                    yield posixpath.normpath(info.filename), archive.read(info)
+        return
+    # Streaming mode, such that compressed archives are decompressed once
+    with tarfile.open(archive_name, 'r|*') as archive:
+        for info in archive:
+            if info.isfile() and posixpath.normpath(info.name) in member_names:
+                yield posixpath.normpath(info.name), archive.extractfile(info).read()
+
+
+def stat_data_file(file_name):
+    """
+    Returns the os.stat of a data file, or of the archive holding it.
+    """
+    in_archive = split_archive_path(file_name)
+    if in_archive is not None:
+        return os.stat(in_archive[0])
+    return os.stat(file_name)
+
+
+def read_data_file(file_name):
+    """
+    Returns the raw, possibly compressed, contents of a data file, which may
+    be a member of an archive.
+    """
+    in_archive = split_archive_path(file_name)
+    if in_archive is None:
+        with open(file_name, 'rb') as data_file:
+            return data_file.read()
+    for _, contents in read_archive_members(in_archive[0], [in_archive[1]]):
+        return contents
+    raise IOError("No member " + in_archive[1] + " in archive " + in_archive[0])
+
+
+def get_compression(magic):
+    """
+    Returns the compression format of a file starting with the provided
+    bytes, or None if the file is not compressed.
+    """
+    for compression, (prefix, _, _) in COMPRESSIONS.items():
+        if magic.startswith(prefix):
+            return compression
+    return None
+
+
+def open_data_file(file_name):
+    """
+    Opens a data file for reading text. Files compressed with gzip, bzip2,
+    xz or zstd are recognized by their first bytes, whatever their
+    extension, and are decompressed while they are read. Files inside
+    archives (see split_archive_path) are read from the archive.
+    """
+    if split_archive_path(file_name) is not None:
+        # Members of archives are read as a whole
+        return io.StringIO(decode_data(read_data_file(file_name)))
+    with open(file_name, 'rb') as data_file:
+        compression = get_compression(data_file.read(MAGIC_LENGTH))
+    if compression is None:
+        return open(file_name, 'r')
+    return COMPRESSIONS[compression][1](file_name)
+
+
+def decode_data(data):
+    """
+    Decompresses, if needed, and decodes the raw contents of a data file,
+    giving the same text as reading it through open_data_file.
+    """
+    compression = get_compression(data[:MAGIC_LENGTH])
+    if compression is not None:
+        data = COMPRESSIONS[compression][2](data)
+    return io.TextIOWrapper(io.BytesIO(data)).read()
+
+
 def read_log_file(filename):
     if not os.path.isfile(filename):
         return
 
-    input_file = open(filename, 'r')
+    input_file = open_data_file(filename)
     data_matrix = []
     for line in input_file:
         line = line.strip()
@@ -56,7 +355,7 @@ def read_log_file(filename):
 
 def get_nr_of_lines(file_name):
     count = 0
-    with open(file_name, 'r') as tmp_file:
+    with open_data_file(file_name) as tmp_file:
         for _ in tmp_file:
             count += 1
     return count
@@ -72,12 +371,33 @@ def is_header_line(line):
 
 
 def skip_header(file_handle):
+    """
+    Skips the first line of the file if it is a header line.
+
+    :return: An iterator over the remaining lines. Streams that cannot seek
+      back (e.g. decompressed files) continue from this iterator rather
+      than from the file handle.
+    """
     first_line = file_handle.readline()
-    if not is_header_line(first_line):
+    if is_header_line(first_line):
+        return file_handle
+    if file_handle.seekable():
         file_handle.seek(0)
+        return file_handle
+    return itertools.chain([first_line], file_handle)
+
 
+def get_split_line(line, separator, nr_of_columns=None):
+    """
+    Splits a line into its non-empty words.
 
-def get_split_line(line, separator):
+    :param nr_of_columns: If provided, only the first nr_of_columns words
+      are guaranteed to be returned. For whitespace separators, the line is
+      then split no further than needed, which saves most of the work for
+      lines much wider than the columns being used.
+    """
+    if nr_of_columns is not None and separator.strip() == "":
+        return line.split(None, nr_of_columns)[:nr_of_columns]
     split_line_temp = line.split(separator)
     split_line = []
     for word in split_line_temp:
@@ -90,28 +410,787 @@ def base(filename):
     return os.path.splitext(os.path.basename(filename))[0]
 
 
-def get_generation(split_line, line_nr):
-    x_from_file = go.get_bool("x_from_file")
-    x_column = go.get_int("x_column")
-    x_values_passed = go.get_exists("x_values")
-    x_values = go.get_int_list("x_values")
+def get_generation(split_line, line_nr, options=None):
+    """
+    :param options: The global_options.OptionSnapshot to read the options
+      from. Defaults to the current snapshot.
+    """
+    return _get_generation(split_line, line_nr, _get_generation_options(options))
+
+
+def _get_generation_options(options=None):
+    """
+    Resolves the options get_generation depends on, such that code reading
+    many lines resolves them once rather than for every line.
+
+    :return: A tuple (x_from_file, x_column, x_values), where x_values is
+      None if no x values were passed.
+    """
+    if options is None:
+        options = go.get_snapshot()
+    x_from_file = options.get_bool("x_from_file")
+    x_column = options.get_int("x_column")
+    x_values_passed = options.get_exists("x_values")
+    x_values = options.get_int_list("x_values")
 
+    return x_from_file, x_column, x_values if x_values_passed else None
+
+
+def _get_generation(split_line, line_nr, generation_options):
+    x_from_file, x_column, x_values = generation_options
     if x_from_file:
         return int(split_line[x_column])
-    elif x_values_passed:
+    elif x_values is not None:
         return int(x_values[line_nr])
     else:
         return line_nr
 
 
-def read_file(file_name, process_line):
-    separator = go.get_str("separator")
-    with open(file_name, 'r') as fh:
+def get_generations(data, line_nrs=None, options=None):
+    """
+    Vectorized version of get_generation: returns the generation of every row
+    of a (lines x columns) array as returned by read_array.
+
+    :param data: The array for which to determine the generations.
+    :param line_nrs: The line number of every row. Defaults to the position
+      of the row in the array.
+    :param options: The global_options.OptionSnapshot to read the options
+      from. Defaults to the current snapshot.
+    :return: An integer array with one generation per row.
+    """
+    x_from_file, x_column, x_values = _get_generation_options(options)
+
+    if line_nrs is None:
+        line_nrs = np.arange(data.shape[0])
+    generations = np.array(line_nrs, dtype=np.int64)
+    if x_from_file and data.shape[1] > 1:
+        return get_column(data, x_column).astype(np.int64)
+    elif x_values is not None:
+        has_x_value = generations < len(x_values)
+        generations[has_x_value] = np.asarray(x_values, dtype=np.int64)[generations[has_x_value]]
+    return generations
+
+
+class LineFilter:
+    """
+    Selects the lines of a data file that are parsed, for files where the
+    generation of a line is its line number.
+
+    A line is selected if its number is a multiple of any of the strides,
+    or if it is the last line, such that the maximum generation available
+    is still known. Lines from "stop" onwards are never selected, nor read.
+    """
+    def __init__(self, strides, stop=None):
+        self.strides = sorted(set(int(stride) for stride in strides))
+        self.stop = stop
+
+    def get_line_nrs(self, nr_of_lines):
+        """
+        :return: The numbers of the selected lines of a file with the
+          provided number of lines.
+        """
+        if self.stop is not None:
+            nr_of_lines = min(nr_of_lines, self.stop)
+        selected = np.zeros(nr_of_lines, dtype=bool)
+        for stride in self.strides:
+            selected[::stride] = True
+        if nr_of_lines > 0:
+            selected[-1] = True
+        return np.flatnonzero(selected)
+
+    def get_key(self):
+        """
+        :return: A JSON serializable description of this filter, stored with
+          parsed data that has been filtered.
+        """
+        return {"strides": self.strides, "stop": self.stop}
+
+
+class ProjectedArray:
+    """
+    The columns of a data file that were parsed when only some of its
+    columns were requested (see parse_text).
+
+    "data" holds one column for every entry of "columns", which maps them to
+    their position in the file, and "shape" is the shape the array would
+    have had if all "nr_of_columns" columns had been parsed. Use get_column
+    or select_columns to index it like the unprojected array.
+    """
+    def __init__(self, data, columns, nr_of_columns):
+        self.data = data
+        self.columns = columns
+        self.nr_of_columns = nr_of_columns
+        self.column_map = {column: i for i, column in enumerate(columns)}
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def shape(self):
+        return self.data.shape[0], self.nr_of_columns
+
+
+def get_column(data, column):
+    """
+    Returns a column of a (lines x columns) array as returned by read_array,
+    which may be a ProjectedArray. Columns that were not parsed are NaN.
+    """
+    if not isinstance(data, ProjectedArray):
+        return data[:, column]
+    if column not in data.column_map:
+        return np.full(len(data), np.nan)
+    return data.data[:, data.column_map[column]]
+
+
+def select_columns(data, columns, file_name=""):
+    """
+    Returns the requested columns of a (lines x columns) array, or of a
+    ProjectedArray, reporting columns that are not available and setting
+    them to NaN.
+    """
+    values = np.full((data.shape[0], len(columns)), np.nan)
+    for i, column in enumerate(columns):
+        if data.shape[1] <= column:
+            print("Error: no data for requested column", column,
+                  "in file", file_name, "(length", data.shape[1], ")")
+        else:
+            values[:, i] = get_column(data, column)
+    return values
+
+
+def _get_delimiter(separator):
+    # get_split_line drops empty words, so a whitespace separator behaves the
+    # same as numpy splitting on any run of whitespace.
+    if separator.strip() == "":
+        return None
+    return separator
+
+
+def _read_ragged(file_handle, separator, columns=None):
+    """
+    Reads the remaining lines of a file one by one, padding short lines with
+    NaN. If columns are provided, only those columns are converted.
+
+    :return: A tuple (data, nr_of_columns), where nr_of_columns is the length
+      of the longest line.
+    """
+    rows = []
+    nr_of_columns = 0
+    for line in file_handle:
+        split_line = get_split_line(line, separator)
+        if len(split_line) > 0:
+            nr_of_columns = max(nr_of_columns, len(split_line))
+            if columns is None:
+                rows.append([float(word) for word in split_line])
+            else:
+                rows.append([float(split_line[column]) if column < len(split_line) else np.nan
+                             for column in columns])
+    width = nr_of_columns if columns is None else len(columns)
+    data = np.full((len(rows), width), np.nan)
+    for i, row in enumerate(rows):
+        data[i, :len(row)] = row
+    return data, nr_of_columns
+
+
+def _get_nr_of_columns(file_handle, separator):
+    """
+    Returns the number of columns on the first non-empty line read from the
+    file handle, and moves the handle back to where it was.
+    """
+    start = file_handle.tell()
+    nr_of_columns = 0
+    for line in iter(file_handle.readline, ""):
+        nr_of_columns = len(get_split_line(line, separator))
+        if nr_of_columns > 0:
+            break
+    file_handle.seek(start)
+    return nr_of_columns
+
+
+def _get_projected_array(data, columns, nr_of_columns):
+    """
+    Returns the projected array parsed for the provided columns of a file as
+    a ProjectedArray, or as is if all columns were parsed.
+    """
+    if columns is None:
+        return data
+    return ProjectedArray(data, columns, nr_of_columns)
+
+
+def get_projected_columns(columns, options=None):
+    """
+    Returns the columns of a data file that have to be parsed to retrieve the
+    provided columns, which includes the column holding the x-values if they
+    are read from file.
+    """
+    # Read global data
+    if options is None:
+        options = go.get_snapshot()
+    x_from_file = options.get_bool("x_from_file")
+    x_column = options.get_int("x_column")
+
+    columns = set(int(column) for column in columns)
+    if x_from_file:
+        columns.add(x_column)
+    return sorted(columns)
+
+
+def get_file_fingerprint(file_name, options=None):
+    """
+    Returns the properties of a file that determine whether a parsed copy of
+    that file is still valid.
+    """
+    if options is None:
+        options = go.get_snapshot()
+    stat = stat_data_file(file_name)
+    return {"source": file_name,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "separator": options.get_str("separator")}
+
+
+def read_array(file_name, cache_file_name=None, executor=None, columns=None, line_filter=None,
+               options=None):
+    """
+    Reads a file with one line per generation into a (lines x columns) float
+    array, skipping the header if there is one.
+
+    The bulk of the work is done by numpy's C parser. Files with lines of
+    unequal length (e.g. a run that crashed while writing its last line) are
+    read line by line instead, with missing values set to NaN.
+
+    If the file has been converted by ingestData.py, its memory-mapped
+    sidecar is returned instead. Otherwise, if a cache file name is
+    provided, the parsed array is read from that
+    cache as long as the size and modification time of the file are
+    unchanged, and written to it otherwise.
+
+    :param file_name: The file to read.
+    :param cache_file_name: The binary cache holding the parsed file.
+    :param executor: A concurrent.futures executor to parse the file on.
+      If None, the file is parsed by the calling thread.
+    :param columns: If provided, only these columns are parsed (see
+      parse_text), and a ProjectedArray may be returned.
+    :param line_filter: If provided, a LineFilter selecting the lines to
+      parse, in which case a tuple (line_nrs, data) is returned, where
+      line_nrs holds the line number of every row of data.
+    :param options: The global_options.OptionSnapshot to read the options
+      from. Defaults to the current snapshot.
+    :return: A two-dimensional float array.
+    """
+    if options is None:
+        options = go.get_snapshot()
+    stored = _read_stored_array(file_name, cache_file_name, columns, line_filter, options)
+    if stored is not None:
+        return stored
+    parsed = _parse_array(file_name, executor, columns, line_filter, options)
+    return _store_array(file_name, cache_file_name, parsed, line_filter, options)
+
+
+def _read_stored_array(file_name, cache_file_name, columns, line_filter, options):
+    """
+    Returns the array read_array would return from the sidecar or cache of
+    the provided file, or None if the file has to be parsed.
+    """
+    data = read_sidecar(file_name, options)
+    if data is not None:
+        return _filter_lines(data, line_filter)
+    if cache_file_name is None:
+        return None
+
+    # Read global data
+    read_cache = options.get_bool("read_cache") and options.get_bool("read_data_cache")
+
+    if read_cache:
+        fingerprint = get_file_fingerprint(file_name, options)
+        try:
+            header, data = cf.read_array_cache(cache_file_name)
+            if (all(header.get(key) == value for key, value in fingerprint.items()) and
+                    _cache_has_columns(header, columns) and
+                    _cache_has_lines(header, line_filter)):
+                debug_print("files", "Reading parsed data for", file_name,
+                            "from cache:", cache_file_name)
+                line_nrs = None
+                if header.get("line_filter") is not None:
+                    line_nrs = line_filter.get_line_nrs(header["nr_of_lines"])
+                elif line_filter is not None:
+                    line_nrs = line_filter.get_line_nrs(data.shape[0])
+                    data = data[line_nrs]
+                return _get_result(data, header.get("columns"), header.get("nr_of_columns"),
+                                   line_nrs, line_filter)
+        except IOError:
+            pass
+        except CacheError:
+            pass
+    return None
+
+
+def _store_array(file_name, cache_file_name, parsed, line_filter, options):
+    """
+    Writes the result of _parse_projected to the cache of the provided file,
+    if caching is enabled, and returns it the way read_array does.
+    """
+    if cache_file_name is None:
+        return _get_result(*parsed, line_filter)
+
+    # Read global data
+    write_cache = options.get_bool("write_cache") and options.get_bool("write_data_cache")
+
+    if write_cache:
+        fingerprint = get_file_fingerprint(file_name, options)
+        data, parsed_columns, nr_of_columns, line_nrs = parsed
+        # Only the parsed columns and lines are stored, so the cache is as
+        # small as the projection.
+        if line_filter is not None:
+            fingerprint["line_filter"] = line_filter.get_key()
+            fingerprint["nr_of_lines"] = int(line_nrs[-1]) + 1 if len(line_nrs) > 0 else 0
+        cf.write_array_cache(cache_file_name, data, columns=parsed_columns,
+                             nr_of_columns=nr_of_columns, **fingerprint)
+    return _get_result(*parsed, line_filter)
+
+
+def _get_result(data, columns, nr_of_columns, line_nrs, line_filter):
+    data = _get_projected_array(data, columns, nr_of_columns)
+    if line_filter is None:
+        return data
+    return line_nrs, data
+
+
+def _filter_lines(data, line_filter):
+    """
+    Selects the lines of a fully parsed array, as read_array does while
+    parsing.
+    """
+    if line_filter is None:
+        return data
+    line_nrs = line_filter.get_line_nrs(data.shape[0])
+    return line_nrs, data[line_nrs]
+
+
+def _cache_has_columns(header, columns):
+    cached_columns = header.get("columns")
+    if cached_columns is None:
+        return True
+    if columns is None or "nr_of_columns" not in header:
+        return False
+    # Columns beyond the end of the file are missing either way
+    return all(column in cached_columns or column >= header["nr_of_columns"]
+               for column in columns)
+
+
+def _cache_has_lines(header, line_filter):
+    cached_filter = header.get("line_filter")
+    if cached_filter is None:
+        return True
+    return line_filter is not None and cached_filter == line_filter.get_key()
+
+
+def _parse_array(file_name, executor=None, columns=None, line_filter=None, options=None):
+    if options is None:
+        options = go.get_snapshot()
+    separator = options.get_str("separator")
+    # Written at once, such that lines from concurrent reads do not mix
+    print("Reading raw data from " + file_name + "...\n", end="")
+    if executor is None:
+        return _parse_file(file_name, separator, columns, line_filter)
+    # The file is read by this thread and parsed by the executor, such that
+    # waiting for the file does not hold up a parser.
+    return executor.submit(_parse_projected, _read_contents(file_name, line_filter), separator,
+                           file_name, columns, line_filter).result()
+
+
+def _read_contents(file_name, line_filter=None):
+    """
+    Reads the contents of a data file to be parsed by another process.
+
+    Compressed files are returned as their raw bytes, such that they are
+    decompressed by the parser. Otherwise, only the text up to the last line
+    that can be selected by the line filter is read.
+    """
+    if line_filter is not None and line_filter.stop is not None and \
+            split_archive_path(file_name) is None:
+        with open(file_name, 'rb') as data_file:
+            compression = get_compression(data_file.read(MAGIC_LENGTH))
+        if compression is None:
+            with open(file_name, 'r') as data_file:
+                return _read_text(data_file, line_filter)
+    return read_data_file(file_name)
+
+
+def _parse_file(file_name, separator, columns=None, line_filter=None):
+    """
+    Opens and parses a data file, as _parse_projected does for its contents.
+    The file is streamed to the parser, and decompressed while it is read,
+    such that it is never held in memory as a whole.
+    """
+    with open_data_file(file_name) as fh:
+        if not fh.seekable():
+            # The parser may have to go back to the start of the file
+            return _parse_projected(_read_text(fh, line_filter), separator, file_name,
+                                    columns, line_filter)
+        return _parse_stream(fh, separator, file_name, columns, line_filter)
+
+
+def _read_text(file_handle, line_filter=None):
+    """
+    Reads a file up to the last line that can be selected by the filter.
+    """
+    if line_filter is None or line_filter.stop is None:
+        return file_handle.read()
+    lines = []
+    nr_of_lines = 0
+    for line in file_handle:
+        lines.append(line)
+        if not line.isspace():
+            nr_of_lines += 1
+            # One line more than needed, in case the first line is a header
+            if nr_of_lines > line_filter.stop:
+                break
+    return "".join(lines)
+
+
+def parse_text(text, separator, file_name="", columns=None):
+    """
+    Parses the contents of a data file into a (lines x columns) float array,
+    as described in read_array. Depends only on its arguments, such that it
+    can be run by a process pool.
+
+    :param columns: If provided, only these columns are converted, which
+      makes the cost of parsing proportional to the number of columns used
+      rather than to the width of the file. The result is then a
+      ProjectedArray, unless all columns had to be parsed.
+    """
+    data, columns, nr_of_columns, _ = _parse_projected(text, separator, file_name, columns)
+    return _get_projected_array(data, columns, nr_of_columns)
+
+
+def _parse_projected(text, separator, file_name="", columns=None, line_filter=None):
+    """
+    Does the work of parse_text, but returns the parsed columns as a plain
+    array, such that only the parsed columns are passed between processes
+    and written to caches.
+
+    Lines that are not selected by the line filter are dropped before any
+    of their values are converted. The text may also be given as the raw,
+    possibly compressed, contents of the file (see decode_data).
+
+    :return: A tuple (data, columns, nr_of_columns, line_nrs), where data
+      holds the parsed columns listed in columns, or all columns if columns
+      is None, and line_nrs the line number of every row of data, or None
+      without a line filter.
+    """
+    if isinstance(text, bytes):
+        text = decode_data(text)
+    return _parse_stream(io.StringIO(text), separator, file_name, columns, line_filter)
+
+
+def _parse_stream(fh, separator, file_name="", columns=None, line_filter=None):
+    """
+    Does the work of _parse_projected, reading from a seekable file handle.
+    """
+    skip_header(fh)
+    line_nrs = None
+    if line_filter is not None:
+        lines = []
+        for line in fh:
+            if not line.isspace():
+                lines.append(line)
+                if line_filter.stop is not None and len(lines) >= line_filter.stop:
+                    break
+        line_nrs = line_filter.get_line_nrs(len(lines))
+        fh = io.StringIO("".join([lines[i] for i in line_nrs]))
+    start = fh.tell()
+    usecols = None
+    nr_of_columns = None
+    if columns is not None and len(columns) > 0 and min(columns) >= 0:
+        nr_of_columns = _get_nr_of_columns(fh, separator)
+        # Columns beyond the first line can only be found by the line by
+        # line reader, so the file is read in full instead.
+        if max(columns) < nr_of_columns:
+            usecols = sorted(set(columns))
+    try:
+        with warnings.catch_warnings():
+            # Empty files are not an error here, they simply hold no data
+            warnings.simplefilter("ignore", UserWarning)
+            data = np.loadtxt(fh, delimiter=_get_delimiter(separator), ndmin=2,
+                              usecols=usecols)
+        if usecols is None:
+            nr_of_columns = data.shape[1]
+    except ValueError:
+        debug_print("files", "Irregular lines in:", file_name)
+        fh.seek(start)
+        data, nr_of_columns = _read_ragged(fh, separator, usecols)
+    return data, usecols, nr_of_columns, line_nrs
+
+
+def get_sidecar_file_names(file_name):
+    """
+    :return: A tuple with the names of the array and the header written for
+      the provided file by ingestData.py.
+    """
+    return file_name + SIDECAR_SUFFIX, file_name + SIDECAR_HEADER_SUFFIX
+
+
+def is_sidecar(path):
+    for suffix in [SIDECAR_SUFFIX, SIDECAR_HEADER_SUFFIX]:
+        if path.endswith(suffix) and os.path.isfile(path[:-len(suffix)]):
+            return True
+    return False
+
+
+def _is_sidecar_name(file_name, file_names):
+    """
+    Same as is_sidecar, but looks up the original file in the provided set of
+    names of the files in the same directory, instead of on disk.
+    """
+    for suffix in [SIDECAR_SUFFIX, SIDECAR_HEADER_SUFFIX]:
+        if file_name.endswith(suffix) and file_name[:-len(suffix)] in file_names:
+            return True
+    return False
+
+
+def write_sidecar(file_name):
+    """
+    Parses the provided file and stores the result next to it, as a .npy
+    array and a JSON header with the column names and the size and
+    modification time of the file.
+
+    The array is stored column by column, such that memory-mapping it only
+    pages in the columns that are actually used.
+    """
+    # Read global data
+    options = go.get_snapshot()
+    separator = options.get_str("separator")
+
+    array_file_name, header_file_name = get_sidecar_file_names(file_name)
+    with open_data_file(file_name) as fh:
+        first_line = fh.readline()
+    columns = None
+    if is_header_line(first_line):
+        columns = get_split_line(first_line.strip(), separator)
+    data, _, _, _ = _parse_array(file_name, options=options)
+    header = get_file_fingerprint(file_name, options)
+    header["columns"] = columns
+    header["shape"] = list(data.shape)
+    with cm.atomic_open(array_file_name, 'wb') as array_file:
+        np.save(array_file, np.asfortranarray(data))
+    with cm.atomic_open(header_file_name, 'w') as header_file:
+        json.dump(header, header_file, indent=2)
+
+
+def read_sidecar(file_name, options=None):
+    """
+    Memory-maps the array written for the provided file by ingestData.py.
+
+    :return: The (lines x columns) array, or None if the file has not been
+      converted or has changed since.
+    """
+    array_file_name, header_file_name = get_sidecar_file_names(file_name)
+    if not os.path.isfile(header_file_name):
+        return None
+    try:
+        with open(header_file_name, 'r') as header_file:
+            header = json.load(header_file)
+    except (IOError, ValueError):
+        return None
+    fingerprint = get_file_fingerprint(file_name, options)
+    for key in ["size", "mtime_ns", "separator"]:
+        if header.get(key) != fingerprint[key]:
+            print("Warning: " + file_name + " changed since it was ingested, "
+                  "reading the original file.")
+            return None
+    try:
+        data = np.load(array_file_name, mmap_mode='r')
+    except (IOError, ValueError):
+        return None
+    debug_print("files", "Reading ingested data for", file_name, "from:", array_file_name)
+    return data
+
+
+def submit_read_arrays(file_names, cache_file_names=None, io_executor=None,
+                       parse_executor=None, columns=None, line_filter=None, options=None):
+    """
+    Reads every file with read_array, overlapping the file I/O on
+    "io_executor" (e.g. a thread pool) and parsing on "parse_executor"
+    (e.g. a process pool). Cached and ingested files are read on the
+    io_executor without being parsed.
+
+    :param io_executor: A concurrent.futures executor to read the files on.
+      If None, the files are read immediately.
+    :param parse_executor: A concurrent.futures executor to parse the files
+      on. If None, each file is parsed by the thread that reads it, while
+      it is being read.
+    :param columns: If provided, only these columns are parsed.
+    :param line_filter: If provided, only the lines selected by this filter
+      are parsed, see read_array.
+    :param options: The global_options.OptionSnapshot to read the options
+      from. Defaults to the current snapshot.
+    :return: A list with one array (or future array) per file, to be passed
+      to collect_arrays.
+    """
+    if options is None:
+        options = go.get_snapshot()
+    if cache_file_names is None:
+        cache_file_names = [None] * len(file_names)
+    arrays = []
+    # Members of the same archive are read together, see _read_archive_arrays
+    archives = dict()
+    for file_name, cache_file_name in zip(file_names, cache_file_names):
+        in_archive = split_archive_path(file_name)
+        if in_archive is not None:
+            future = Future()
+            archives.setdefault(in_archive[0], []).append((file_name, cache_file_name, future))
+            arrays.append(future)
+        elif io_executor is None:
+            arrays.append(read_array(file_name, cache_file_name, parse_executor, columns,
+                                     line_filter, options))
+        else:
+            arrays.append(io_executor.submit(read_array, file_name, cache_file_name,
+                                             parse_executor, columns, line_filter, options))
+    for archive_name, members in archives.items():
+        if io_executor is None:
+            _read_archive_arrays(archive_name, members, parse_executor, columns, line_filter,
+                                 options)
+        else:
+            io_executor.submit(_read_archive_arrays, archive_name, members, parse_executor,
+                               columns, line_filter, options)
+    return arrays
+
+
+def _read_archive_arrays(archive_name, members, parse_executor, columns, line_filter, options):
+    """
+    Reads files from the same archive as read_array would, but reads all
+    members that are not cached in a single pass over the archive, which
+    avoids decompressing the archive once for every member.
+
+    :param members: A list of (file_name, cache_file_name, future) tuples,
+      where the result of reading each file is set on its future.
+    """
+    # Read global data
+    separator = options.get_str("separator")
+
+    error = None
+    try:
+        pending = dict()
+        for file_name, cache_file_name, future in members:
+            stored = _read_stored_array(file_name, cache_file_name, columns, line_filter,
+                                        options)
+            if stored is not None:
+                future.set_result(stored)
+            else:
+                pending[split_archive_path(file_name)[1]] = (file_name, cache_file_name, future)
+        parsed = []
+        for member_name, contents in read_archive_members(archive_name, pending):
+            file_name, cache_file_name, future = pending[member_name]
+            print("Reading raw data from " + file_name + "...\n", end="")
+            if parse_executor is None:
+                result = _parse_projected(contents, separator, file_name, columns, line_filter)
+            else:
+                result = parse_executor.submit(_parse_projected, contents, separator, file_name,
+                                               columns, line_filter)
+            parsed.append((file_name, cache_file_name, future, result))
+        for file_name, cache_file_name, future, result in parsed:
+            if isinstance(result, Future):
+                result = result.result()
+            future.set_result(_store_array(file_name, cache_file_name, result, line_filter,
+                                           options))
+    except Exception as e:
+        error = e
+    # Waiting for any of the files should not hang if the others failed
+    for file_name, _, future in members:
+        if not future.done():
+            future.set_exception(error or IOError("No member " + file_name + " in archive " +
+                                                  archive_name))
+
+
+def collect_arrays(arrays):
+    """
+    Waits for the reads started by submit_read_arrays.
+
+    :return: The arrays, in the order in which the files were submitted.
+    """
+    return [array.result() if isinstance(array, Future) else array for array in arrays]
+
+
+def read_runs(file_names, columns, cache_file_names=None, arrays=None, line_filter=None,
+              options=None):
+    """
+    Reads every file as a separate run and aligns the runs on generation.
+
+    :param file_names: The files to read, one run per file.
+    :param columns: The columns to retrieve from each file.
+    :param cache_file_names: Optionally, the cache holding the parsed data
+      of each file (see read_array).
+    :param arrays: Optionally, the already parsed data of each file (see
+      collect_arrays), in which case the files are not read again.
+    :param line_filter: If provided, only the lines selected by this filter
+      are read, and arrays holds (line_nrs, data) tuples (see read_array).
+    :param options: The global_options.OptionSnapshot to read the options
+      from. Defaults to the current snapshot.
+    :return: A tuple (generations, data), where generations is the sorted
+      array of all generations found in any of the files, and data is a
+      (runs x generations x columns) array. Generations that are missing
+      from a run (e.g. because it stopped early) are NaN.
+    """
+    if options is None:
+        options = go.get_snapshot()
+    if arrays is None:
+        arrays = collect_arrays(submit_read_arrays(file_names, cache_file_names,
+                                                   columns=get_projected_columns(columns, options),
+                                                   line_filter=line_filter, options=options))
+    runs = []
+    for file_name, data in zip(file_names, arrays):
+        line_nrs = None
+        if line_filter is not None:
+            line_nrs, data = data
+        runs.append((get_generations(data, line_nrs, options),
+                     select_columns(data, columns, file_name)))
+
+    if len(runs) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 0, len(columns)))
+    generations = np.unique(np.concatenate([run_gens for run_gens, _ in runs]))
+    result = np.full((len(runs), len(generations), len(columns)), np.nan)
+    for i, (run_gens, values) in enumerate(runs):
+        result[i, np.searchsorted(generations, run_gens), :] = values
+    return generations, result
+
+
+def read_file(file_name, process_line, columns=None):
+    """
+    Calls process_line with the split line and generation of every line of
+    the provided file, until it returns True.
+
+    :param columns: If provided, the columns used by process_line. Lines are
+      then split no further than the last of these columns (see
+      get_split_line).
+    """
+    options = go.get_snapshot()
+    separator = options.get_str("separator")
+    generation_options = _get_generation_options(options)
+    nr_of_columns = None
+    if columns is not None:
+        columns = get_projected_columns(columns)
+        # Negative columns are counted from the end of the line
+        if len(columns) > 0 and columns[0] >= 0:
+            nr_of_columns = columns[-1] + 1
+    data = read_sidecar(file_name)
+    if data is not None:
+        for i, row in enumerate(data):
+            # Lines shorter than the longest line are padded with NaN
+            length = len(row)
+            while length > 0 and np.isnan(row[length - 1]):
+                length -= 1
+            split_line = row[:length]
+            generation = _get_generation(split_line, i, generation_options)
+            done = process_line(split_line, generation)
+            if done:
+                break
+        return
+    with open_data_file(file_name) as fh:
         print("Reading raw data from " + file_name + "...")
-        skip_header(fh)
-        for i, line in enumerate(fh):
-            split_line = get_split_line(line, separator)
-            generation = get_generation(split_line, i)
+        for i, line in enumerate(skip_header(fh)):
+            split_line = get_split_line(line, separator, nr_of_columns)
+            generation = _get_generation(split_line, i, generation_options)
             done = process_line(split_line, generation)
             if done:
                 break
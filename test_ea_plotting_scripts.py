@@ -1,26 +1,85 @@
+import os
+import bz2
+import copy
+import contextlib
+import gzip
+import io
+import lzma
+import tarfile
+import tempfile
 import unittest
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import createPlots
 import createBarplot
+import createPlotUtils as util
+import parse_file as pf
+import cache_file as cf
+import cache_manager as cm
 import treatment_list as tl
 import global_options as go
 
+# Options read by parse_file
+READ_OPTIONS = {"separator": [" "], "x_from_file": [False], "x_column": [0], "x_values": []}
+
+# Options read while reading the raw data of a treatment
+RAW_DATA_OPTIONS = dict(READ_OPTIONS, templates=[], pool=[], pool_reducer=["max"],
+                        scan_threads=[1], one_value_per_dir=[False], to_plot=[1], step=[1],
+                        workers=[1], io_threads=[1], stats=["median_and_interquartile_range"],
+                        bootstrap=[False], cache_dir=[""], cache_size=[cm.CACHE_SIZE])
+
+
+class OptionsTestCase(unittest.TestCase):
+    """
+    Sets the global options in "options" before every test, and restores all
+    global options after every test, such that tests do not depend on the
+    options set by the tests that ran before them.
+    """
+    options = dict()
+
+    def setUp(self):
+        self.saved_options = copy.deepcopy(go.global_options)
+        self.set_options(self.options)
+
+    def tearDown(self):
+        go.global_options.clear()
+        self.set_options(self.saved_options)
+        go.global_snapshot = None
+
+    @staticmethod
+    def set_options(options):
+        for name, value in options.items():
+            go.set_glb(name, value)
+
+
+class TestCreatePlots(OptionsTestCase):
+    def setUp(self):
+        super().setUp()
+        # Keep the cache files out of the examples directory
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+        super().tearDown()
 
-class TestCreatePlots(unittest.TestCase):
     def test_example_config(self):
         createPlots.init_options()
-        createPlots.execute_plots(["-c", "examples/exampleConfig.txt", "--debug", "plot", "--debug", "files"])
+        createPlots.execute_plots(["-c", "examples/exampleConfig.txt", "--debug", "plot", "--debug", "files",
+                                   "--cache_dir", self.cache_dir.name])
 
     def test_minimal_config(self):
         createPlots.init_options()
-        createPlots.execute_plots(["-c", "examples/minimalConfig.txt", "--debug", "plot", "--debug", "files"])
+        createPlots.execute_plots(["-c", "examples/minimalConfig.txt", "--debug", "plot", "--debug", "files",
+                                   "--cache_dir", self.cache_dir.name])
 
     def test_four_treatments_config(self):
         createPlots.init_options()
         createPlots.execute_plots(["-c", "examples/fourTreatmentsConfig.txt",
-                                   "--debug", "plot", "--debug", "files"])
+                                   "--debug", "plot", "--debug", "files",
+                                   "--cache_dir", self.cache_dir.name])
 
 
-class TestCreateBarplot(unittest.TestCase):
+class TestCreateBarplot(OptionsTestCase):
     def test_example_config(self):
         createBarplot.init_options()
         createBarplot.execute_plots(["-c", "examples/barplotExampleConfig.txt", "--debug", "plot",
@@ -32,7 +91,7 @@ class TestCreateBarplot(unittest.TestCase):
                                      "--debug", "files", "--debug", "data"])
 
 
-class TestTreatmentList(unittest.TestCase):
+class TestTreatmentList(OptionsTestCase):
     def test_hash_list_of_strings(self):
         hash1 = tl.hash_list_of_strings(["a", "b", "c"])
         hash2 = tl.hash_list_of_strings(["a", "b", "d"])
@@ -53,6 +112,583 @@ class TestTreatmentList(unittest.TestCase):
         self.assertEqual(tl.create_prefix(root_dir, files),
                          tl.hash_list_of_strings(["run_1", "run_2"])[:16] + "_data.dat")
 
+    def test_file_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "data.dat")
+            with open(file_name, "w") as data_file:
+                data_file.write("1 2\n")
+            manifest = tl.get_file_manifest([file_name])
+            self.assertEqual(manifest[0][:2], (file_name, 4))
+            with open(file_name, "a") as data_file:
+                data_file.write("3 4\n")
+            self.assertNotEqual(tl.get_file_manifest([file_name]), manifest)
+
+    def test_options_fingerprint(self):
+        go.set_glb("step", 2)
+        fingerprint = tl.get_options_fingerprint(["step", "undefined_option"])
+        self.assertEqual(fingerprint, ["step", "1", "2"])
+
+
+class TestGlobalOptions(OptionsTestCase):
+    def test_snapshot(self):
+        go.set_glb("step", ["2"])
+        go.set_glb("to_plot", [["1", "2"], "3"])
+        go.set_glb("sig", ["False"])
+        snapshot = go.get_snapshot()
+        self.assertIs(go.get_snapshot(), snapshot)
+        self.assertEqual(snapshot.get_int("step"), go.get_int("step"))
+        self.assertEqual(snapshot.get_int_list("to_plot"), [1, 2])
+        self.assertEqual(snapshot.get_int_list("to_plot", 1), go.get_int_list("to_plot", 1))
+        self.assertEqual(snapshot.get_str("to_plot", 2, when_not_exist=go.RETURN_INDEX),
+                         "undefined-2")
+        self.assertFalse(snapshot.get_bool("sig"))
+        self.assertEqual(snapshot.get_any("to_plot", 5, when_not_exist=go.RETURN_FIRST),
+                         go.get_any("to_plot", 5, when_not_exist=go.RETURN_FIRST))
+        # Values handed out by a snapshot cannot change it
+        snapshot.get_int_list("to_plot").append(4)
+        self.assertEqual(snapshot.get_int_list("to_plot"), [1, 2])
+        with self.assertRaises(AttributeError):
+            snapshot.step = 3
+        go.set_glb("step", ["4"])
+        self.assertEqual(snapshot.get_int("step"), 2)
+        self.assertEqual(go.get_snapshot().get_int("step"), 4)
+
+
+class TestCreatePlotUtils(unittest.TestCase):
+    def test_debug_print(self):
+        class Unprintable:
+            def __str__(self):
+                raise AssertionError("Formatted a disabled debug message")
+
+        util.debug_print("test_disabled", Unprintable())
+        util.get_debug_print("test_disabled")(Unprintable())
+        util.debug_enabled["test_enabled"] = True
+        try:
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                util.get_debug_print("test_enabled")("value:", 1)
+            self.assertIn("test_enabled", output.getvalue())
+            self.assertIn("value: 1", output.getvalue())
+        finally:
+            del util.debug_enabled["test_enabled"]
+
+
+class TestRawData(unittest.TestCase):
+    def test_ragged_runs(self):
+        raw_data = createPlots.RawData()
+        data = np.array([[[1.0], [2.0], [3.0]],
+                         [[4.0], [5.0], [np.nan]]])
+        raw_data.add_runs([1], np.array([0, 1, 2]), data)
+        self.assertIn(1, raw_data)
+        self.assertNotIn(2, raw_data)
+        np.testing.assert_array_equal(raw_data[1].keys(), [0, 1, 2])
+        np.testing.assert_array_equal(raw_data.get(1, 1), [2.0, 5.0])
+        np.testing.assert_array_equal(raw_data[1][2], [3.0])
+        self.assertEqual(raw_data.get_max_generation(1), 2)
+        self.assertEqual(raw_data.get_matrix(1).shape, (2, 3))
+
+    def test_add_values(self):
+        raw_data = createPlots.RawData()
+        raw_data.add_values([1], np.array([1, 0, 1, 1]), np.array([[1.0], [2.0], [3.0], [4.0]]))
+        np.testing.assert_array_equal(raw_data[1][0], [2.0])
+        np.testing.assert_array_equal(raw_data[1][1], [1.0, 3.0, 4.0])
+        self.assertEqual(raw_data.get_matrix(1).shape, (3, 2))
+
+    def test_pool_runs(self):
+        runs = [np.array([[1.0], [4.0], [2.0]]), np.array([[3.0], [np.nan]])]
+        np.testing.assert_array_equal(createPlots.pool_runs(runs, "max"), [[3.0], [4.0], [2.0]])
+        np.testing.assert_array_equal(createPlots.pool_runs(runs, "min"), [[1.0], [4.0], [2.0]])
+        np.testing.assert_array_equal(createPlots.pool_runs(runs, "mean"), [[2.0], [4.0], [2.0]])
+        np.testing.assert_array_equal(createPlots.pool_runs(runs, "best_so_far"),
+                                      [[3.0], [4.0], [4.0]])
+        self.assertEqual(createPlots.pool_runs([], "median", 2).shape, (0, 2))
+
+
+class TestStats(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = rng.random((11, 40))
+        self.values[7:, 20:] = np.nan
+        self.values[1:, 39] = np.nan
+
+    def columns(self):
+        for i in range(self.values.shape[1]):
+            column = self.values[:, i]
+            yield i, column[~np.isnan(column)]
+
+    def test_median_and_interquartile_range_array(self):
+        median, ci_min, ci_max = util.calc_stats_array(self.values, "median_and_interquartile_range")
+        for i, data in self.columns():
+            self.assertEqual((median[i], ci_min[i], ci_max[i]),
+                             util.calc_median_and_interquartile_range(list(data)))
+
+    def test_mean_and_std_error_array(self):
+        median, ci_min, ci_max = util.calc_stats_array(self.values, "mean_and_std_error")
+        for i, data in self.columns():
+            np.testing.assert_allclose((median[i], ci_min[i], ci_max[i]),
+                                       util.calc_mean_and_std_error(list(data)))
+
+    def test_bootstrap_array(self):
+        rng = np.random.default_rng(1)
+        values = rng.normal(size=(200, 6))
+        values[100:, 3:] = np.nan
+        for method in ['percentile', 'pivotal']:
+            stat, ci_min, ci_max = util.bootstrap_array(values, 0.95, 2000, np.mean, method,
+                                                        chunk_size=1, rng=rng)
+            for i in range(values.shape[1]):
+                data = values[:, i][~np.isnan(values[:, i])]
+                self.assertEqual(stat[i], np.mean(data))
+                # The bootstrapped interval should approximate the normal interval
+                half_width = 1.96 * np.std(data) / np.sqrt(len(data))
+                self.assertAlmostEqual(ci_min[i], stat[i] - half_width, delta=0.25 * half_width)
+                self.assertAlmostEqual(ci_max[i], stat[i] + half_width, delta=0.25 * half_width)
+
+    def test_bca_array(self):
+        rng = np.random.default_rng(2)
+        values = rng.normal(size=(200, 4))
+        values[:, 3] = 1.0
+        stat, ci_min, ci_max = util.bootstrap_array(values, 0.95, 2000, np.median, 'bca',
+                                                    chunk_size=1, rng=rng)
+        for i in range(3):
+            self.assertLess(ci_min[i], stat[i])
+            self.assertGreater(ci_max[i], stat[i])
+        # Repeated values leave the interval undefined
+        self.assertEqual((stat[3], ci_min[3], ci_max[3]), (1.0, 1.0, 1.0))
+
+    def test_jackknife_distribution(self):
+        values = np.random.default_rng(3).random((7, 5))
+        for statfunction in [np.mean, np.median]:
+            jack_stats = util.jackknife_distribution(values, statfunction, chunk_size=1)
+            for i in range(values.shape[0]):
+                np.testing.assert_allclose(jack_stats[i],
+                                           statfunction(np.delete(values, i, axis=0), axis=0))
+
+    def test_stats_blocks_reproducible(self):
+        stats = "median_and_bootstrap_percentile"
+        serial = util.collect_stats_blocks(
+            util.submit_stats_blocks(self.values, stats, 42, (0, 1), block_size=7))
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            parallel = util.collect_stats_blocks(
+                util.submit_stats_blocks(self.values, stats, 42, (0, 1), executor, block_size=7))
+        for serial_array, parallel_array in zip(serial, parallel):
+            self.assertEqual(len(serial_array), self.values.shape[1])
+            np.testing.assert_array_equal(serial_array, parallel_array)
+
+    def test_mann_whitney_u_array(self):
+        rng = np.random.default_rng(4)
+        values1 = rng.integers(0, 5, size=(12, 30)).astype(float)
+        values2 = rng.integers(1, 6, size=(10, 30)).astype(float)
+        values1[:, :10] = rng.random((12, 10))
+        values2[:, :10] = rng.random((10, 10))
+        values2[4:, :5] = np.nan
+        values1[rng.random(values1.shape) < 0.2] = np.nan
+        values1[:, 29] = 1.0
+        values2[:, 29] = 1.0
+        u_statistic, p_value = util.mann_whitney_u_array(values1, values2)
+        for i in range(values1.shape[1]):
+            data1 = values1[:, i][~np.isnan(values1[:, i])]
+            data2 = values2[:, i][~np.isnan(values2[:, i])]
+            self.assertAlmostEqual(p_value[i], util.mann_whitney_u(data1, data2))
+        self.assertEqual(p_value[29], 1.0)
+
+
+class TestParseFile(OptionsTestCase):
+    options = READ_OPTIONS
+
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+        super().tearDown()
+
+    def write_file(self, name, content):
+        file_name = os.path.join(self.temp_dir.name, name)
+        with open(file_name, 'w') as f:
+            f.write(content)
+        return file_name
+
+    def test_read_runs(self):
+        file1 = self.write_file("run1.dat", "gen fitness\n0 0.5\n1 0.6\n2 0.7\n")
+        file2 = self.write_file("run2.dat", "0  0.1\n1  0.2\n")
+        generations, data = pf.read_runs([file1, file2], [1])
+        np.testing.assert_array_equal(generations, [0, 1, 2])
+        self.assertEqual(data.shape, (2, 3, 1))
+        np.testing.assert_array_equal(data[0, :, 0], [0.5, 0.6, 0.7])
+        np.testing.assert_array_equal(data[1, :2, 0], [0.1, 0.2])
+        self.assertTrue(np.isnan(data[1, 2, 0]))
+
+    def test_read_runs_x_from_file(self):
+        go.set_glb("x_from_file", [True])
+        file1 = self.write_file("run1.dat", "0 0.5\n10 0.6\n20 0.7 1.0\n")
+        generations, data = pf.read_runs([file1], [1])
+        np.testing.assert_array_equal(generations, [0, 10, 20])
+        np.testing.assert_array_equal(data[0, :, 0], [0.5, 0.6, 0.7])
+
+    def test_submit_read_arrays(self):
+        file_names = [self.write_file("run" + str(i) + ".dat", "0 " + str(i) + "\n1 2 3\n")
+                      for i in range(5)]
+        serial = pf.collect_arrays(pf.submit_read_arrays(file_names))
+        with ThreadPoolExecutor(max_workers=3) as io_executor:
+            with ProcessPoolExecutor(max_workers=2) as parse_executor:
+                parallel = pf.collect_arrays(pf.submit_read_arrays(
+                    file_names, io_executor=io_executor, parse_executor=parse_executor))
+        for i, (expected, actual) in enumerate(zip(serial, parallel)):
+            np.testing.assert_array_equal(expected, actual)
+            self.assertEqual(actual[0, 1], i)
+
+    def test_parse_executor(self):
+        content = "gen fitness\n" + "".join(str(i) + " " + str(i / 10) + "\n" for i in range(10))
+        file_name = self.write_file("run1.dat", content)
+        compressed_name = os.path.join(self.temp_dir.name, "run2.dat.gz")
+        with gzip.open(compressed_name, 'wt') as data_file:
+            data_file.write(content)
+        line_filter = pf.LineFilter([4], 6)
+        with ProcessPoolExecutor(max_workers=2) as parse_executor:
+            for name in [file_name, compressed_name]:
+                np.testing.assert_array_equal(pf.read_array(name, executor=parse_executor),
+                                              pf.read_array(name))
+                line_nrs, data = pf.read_array(name, executor=parse_executor,
+                                               line_filter=line_filter)
+                np.testing.assert_array_equal(line_nrs, [0, 4, 5])
+                np.testing.assert_array_equal(data[:, 1], [0, 0.4, 0.5])
+
+    def test_read_array_cache(self):
+        for option in ["read_cache", "write_cache", "read_data_cache", "write_data_cache"]:
+            go.set_glb(option, [True])
+        file_name = self.write_file("run1.dat", "0 0.5\n1 0.6\n")
+        cache_file_name = os.path.join(self.temp_dir.name, "ch_data.cache")
+        np.testing.assert_array_equal(pf.read_array(file_name, cache_file_name),
+                                      [[0, 0.5], [1, 0.6]])
+        # A cache for an unchanged file is used instead of the file itself
+        fingerprint = pf.get_file_fingerprint(file_name)
+        cf.write_array_cache(cache_file_name, np.zeros((1, 2)), **fingerprint)
+        np.testing.assert_array_equal(pf.read_array(file_name, cache_file_name), [[0, 0]])
+        with open(file_name, 'a') as data_file:
+            data_file.write("2 0.7\n")
+        self.assertEqual(pf.read_array(file_name, cache_file_name).shape, (3, 2))
+        self.assertEqual(cf.read_array_cache(cache_file_name)[1].shape, (3, 2))
+
+    def test_column_projection(self):
+        text = "gen a b c\n0 0.5 1 x\n1 0.6 2 y\n2 0.7\n"
+        data = pf.parse_text(text, " ", columns=[0, 1])
+        self.assertEqual(data.shape, (3, 4))
+        self.assertEqual(data.data.shape, (3, 2))
+        np.testing.assert_array_equal(pf.select_columns(data, [0, 1]),
+                                      [[0, 0.5], [1, 0.6], [2, 0.7]])
+        self.assertTrue(np.all(np.isnan(pf.get_column(data, 2))))
+        np.testing.assert_array_equal(pf.select_columns(pf.parse_text("0 1 2\n3 4 5\n", " ",
+                                                                      columns=[2]), [1, 2]),
+                                      [[np.nan, 2], [np.nan, 5]])
+
+        for option in ["read_cache", "write_cache", "read_data_cache", "write_data_cache"]:
+            go.set_glb(option, [True])
+        file_name = self.write_file("run1.dat", "0 0.5 1\n1 0.6 2\n")
+        cache_file_name = os.path.join(self.temp_dir.name, "ch_data.cache")
+        pf.read_array(file_name, cache_file_name, columns=[1])
+        self.assertEqual(cf.read_array_cache(cache_file_name)[1].shape, (2, 1))
+        # Requesting a column that was not cached parses the file again
+        np.testing.assert_array_equal(pf.select_columns(pf.read_array(file_name, cache_file_name,
+                                                                      columns=[2]), [1, 2]),
+                                      [[np.nan, 1], [np.nan, 2]])
+        self.assertEqual(pf.get_split_line("0 1  2 3\n", " ", 2), ["0", "1"])
+
+    def test_line_filter(self):
+        line_filter = pf.LineFilter([3, 2], stop=8)
+        np.testing.assert_array_equal(line_filter.get_line_nrs(20), [0, 2, 3, 4, 6, 7])
+        np.testing.assert_array_equal(line_filter.get_line_nrs(6), [0, 2, 3, 4, 5])
+        self.assertEqual(len(line_filter.get_line_nrs(0)), 0)
+
+        file_name = self.write_file("run1.dat", "gen fitness\n" +
+                                    "".join(str(i) + " " + str(i / 10) + "\n" for i in range(10)))
+        line_nrs, data = pf.read_array(file_name, line_filter=pf.LineFilter([4]))
+        np.testing.assert_array_equal(line_nrs, [0, 4, 8, 9])
+        np.testing.assert_array_equal(data[:, 0], [0, 4, 8, 9])
+        generations, data = pf.read_runs([file_name], [1], line_filter=pf.LineFilter([4], 6))
+        np.testing.assert_array_equal(generations, [0, 4, 5])
+        np.testing.assert_array_equal(data[0, :, 0], [0, 0.4, 0.5])
+
+    def test_compressed_files(self):
+        content = "gen fitness\n0 0.5\n1 0.6\n2 0.7\n"
+        for extension, compress in [("gz", gzip.compress), ("bz2", bz2.compress),
+                                    ("xz", lzma.compress), ("dat", lambda data: data)]:
+            file_name = os.path.join(self.temp_dir.name, "run1." + extension)
+            with open(file_name, 'wb') as data_file:
+                data_file.write(compress(content.encode()))
+            np.testing.assert_array_equal(pf.read_array(file_name), [[0, 0.5], [1, 0.6], [2, 0.7]])
+            line_nrs, _ = pf.read_array(file_name, line_filter=pf.LineFilter([2], 2))
+            np.testing.assert_array_equal(line_nrs, [0, 1])
+            self.assertEqual(pf.get_nr_of_lines(file_name), 4)
+            lines = []
+            pf.read_file(file_name, lambda split_line, generation: lines.append(split_line))
+            self.assertEqual(lines[2], ["2", "0.7\n"])
+
+    def test_archive(self):
+        runs = dict()
+        for i in range(3):
+            runs["./run_" + str(i) + "/fit.dat"] = ("0 " + str(i) + "\n1 2\n").encode()
+        archive_name = os.path.join(self.temp_dir.name, "treatment.tar.gz")
+        with tarfile.open(archive_name, 'w:gz') as archive:
+            for name, contents in runs.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(contents)
+                archive.addfile(info, io.BytesIO(contents))
+        self.assertEqual(pf.get_dirs(["run_"], archive_name),
+                         [archive_name + "/run_" + str(i) for i in range(3)])
+        file_names = pf.get_files(["run_.*", "fit.dat"], archive_name)
+        self.assertEqual(file_names, [archive_name + "/run_" + str(i) + "/fit.dat" for i in range(3)])
+        with ThreadPoolExecutor(max_workers=2) as io_executor:
+            arrays = pf.collect_arrays(pf.submit_read_arrays(file_names, io_executor=io_executor))
+        for i, data in enumerate(arrays):
+            np.testing.assert_array_equal(data, [[0, i], [1, 2]])
+        np.testing.assert_array_equal(pf.read_array(file_names[1]), arrays[1])
+        with self.assertRaises(IOError):
+            pf.collect_arrays(pf.submit_read_arrays([archive_name + "/run_3/fit.dat"]))
+
+    def test_scan_manifest(self):
+        treatment_dir = os.path.join(self.temp_dir.name, "treatment")
+        run_dirs = [os.path.join(treatment_dir, "run_" + str(i)) for i in range(3)]
+        for run_dir in run_dirs:
+            os.makedirs(run_dir)
+            self.write_file(os.path.join(run_dir, "fit.dat"), "0 1\n")
+        # Directories modified just before they are listed are not remembered
+        for directory in [treatment_dir] + run_dirs:
+            os.utime(directory, ns=(10**18, 10**18))
+        templates = ["run_.*", "fit.dat"]
+        file_names = sorted(pf.get_files(templates, treatment_dir))
+        manifest_name = os.path.join(self.temp_dir.name, "ch_scan_test.cache")
+        manifest = pf.ScanManifest(manifest_name)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.assertEqual(sorted(pf.get_files(templates, treatment_dir, executor, manifest)),
+                             file_names)
+        self.assertTrue(manifest.write())
+
+        # A directory is only listed again once its modification time changes
+        os.remove(os.path.join(run_dirs[1], "fit.dat"))
+        os.utime(run_dirs[1], ns=(10**18, 10**18))
+        manifest = pf.ScanManifest(manifest_name)
+        self.assertEqual(sorted(pf.get_files(templates, treatment_dir, manifest=manifest)),
+                         file_names)
+        self.assertFalse(manifest.write())
+        os.utime(run_dirs[1], ns=(10**18, 10**18 + 1))
+        manifest = pf.ScanManifest(manifest_name)
+        self.assertEqual(sorted(pf.get_files(templates, treatment_dir, manifest=manifest)),
+                         [file_names[0], file_names[2]])
+        self.assertTrue(manifest.write())
+
+        # Manifests are only stored in the cache directory
+        go.set_glb("scan_manifest", [True])
+        go.set_glb("cache_size", [cm.CACHE_SIZE])
+        go.set_glb("cache_dir", [""])
+        self.assertIsNone(tl.get_scan_manifest(treatment_dir))
+        cache_dir = os.path.join(self.temp_dir.name, "cache")
+        go.set_glb("cache_dir", [cache_dir])
+        manifest = tl.get_scan_manifest(treatment_dir)
+        self.assertEqual(os.path.dirname(manifest.file_name), cache_dir)
+
+    def test_sidecar(self):
+        file_name = self.write_file("run1.dat", "gen fitness\n0 0.5\n1 0.6\n")
+        self.assertIsNone(pf.read_sidecar(file_name))
+        pf.write_sidecar(file_name)
+        self.assertEqual(pf.get_files([".*"], self.temp_dir.name), [file_name])
+        data = pf.read_sidecar(file_name)
+        self.assertIsInstance(data, np.memmap)
+        self.assertTrue(data.flags.f_contiguous)
+        np.testing.assert_array_equal(pf.read_array(file_name), [[0, 0.5], [1, 0.6]])
+        with open(file_name, 'a') as data_file:
+            data_file.write("2 0.7\n")
+        self.assertIsNone(pf.read_sidecar(file_name))
+        self.assertEqual(pf.read_array(file_name).shape, (3, 2))
+
+
+class TestComparisonCache(OptionsTestCase):
+    options = dict(RAW_DATA_OPTIONS, stat_test_step=[2], comparison_main=[], max_generation=[100],
+                   sig=[True], read_cache=[True], read_comparison_cache=[True])
+
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        go.set_glb("comparison_cache", [os.path.join(self.temp_dir.name, "comparison.cache")])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+        super().tearDown()
+
+    def test_grown_runs(self):
+        go.set_glb("max_generation", [createPlots.MAX_GEN_NOT_PROVIDED])
+        for option in ["write_cache", "read_median_ci_cache", "read_data_cache", "write_data_cache"]:
+            go.set_glb(option, [False])
+        file_name = os.path.join(self.temp_dir.name, "fit.dat")
+        with open(file_name, 'w') as data_file:
+            data_file.write("".join(str(i) + " 0.5\n" for i in range(101)))
+        data_intr = createPlots.DataOfInterest([tl.Treatment(0, [file_name])])
+        data_intr.comparison_cache = dict()
+        data_intr.to_cache()
+        cached = createPlots.DataOfInterest([tl.Treatment(0, [file_name])])
+        self.assertEqual(cached.get_cached_max_generation(), 100)
+        # A cache written before the runs grew does not limit the max generation
+        with open(file_name, 'a') as data_file:
+            data_file.write("".join(str(i) + " 0.5\n" for i in range(101, 151)))
+        grown = createPlots.DataOfInterest([tl.Treatment(0, [file_name])])
+        self.assertIsNone(grown.get_cached_max_generation())
+        self.assertEqual(grown.get_max_generation(), 150)
+
+    def test_round_trip(self):
+        data_intr = createPlots.DataOfInterest([])
+        comparison = createPlots.Comparison([0, 2, 4], [10.0, 3.0, 1.0], [0.5, 0.02, 0.001])
+        data_intr.comparison_cache = {(0, 1, 1): comparison, (0, 2, 1): createPlots.Comparison()}
+        data_intr.to_cache()
+
+        cached = createPlots.DataOfInterest([])
+        cached.comparison_cache = dict()
+        cached.init_compare_from_cache()
+        self.assertEqual(len(cached.get_comparison(0, 2, 1)), 0)
+        comparison = cached.get_comparison(0, 1, 1)
+        np.testing.assert_array_equal(comparison.statistics, [10.0, 3.0, 1.0])
+        np.testing.assert_array_equal(comparison.get_significant(0.05), [2, 4])
+        np.testing.assert_array_equal(comparison.get_significant(0.01), [4])
+        # The max generation comes from the data, not the max_generation option
+        self.assertIsNone(cached.get_cached_max_generation())
+
+    def test_different_step(self):
+        data_intr = createPlots.DataOfInterest([])
+        data_intr.comparison_cache = {(0, 1, 1): createPlots.Comparison([0], [1.0], [0.5])}
+        data_intr.to_cache()
+        go.set_glb("stat_test_step", [1])
+        cached = createPlots.DataOfInterest([])
+        cached.comparison_cache = dict()
+        self.assertRaises(createPlots.CacheError, cached.init_compare_from_cache)
+
+
+class TestPartCache(OptionsTestCase):
+    options = dict(RAW_DATA_OPTIONS, read_cache=[True], write_cache=[True],
+                   read_data_cache=[True], write_data_cache=[True])
+
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        go.set_glb("cache_dir", [os.path.join(self.temp_dir.name, "cache")])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+        super().tearDown()
+
+    def test_inserted_directory(self):
+        file_name = os.path.join(self.temp_dir.name, "fit.dat")
+        with open(file_name, 'w') as data_file:
+            data_file.write("0 0.5\n")
+        data = createPlots.DataSingleTreatment(tl.Treatment(0, [file_name]))
+        generations, values = data.combine_part(0, [file_name], pf.submit_read_arrays([file_name]))
+        np.testing.assert_array_equal(generations, [0])
+        # The cache stays valid when the directory moves to another position
+        generations, cached_values = data.read_part_cache(2, [file_name])
+        np.testing.assert_array_equal(generations, [2])
+        np.testing.assert_array_equal(cached_values, values)
+        go.set_glb("x_values", [[5, 10, 20]])
+        np.testing.assert_array_equal(data.read_part_cache(1, [file_name])[0], [10])
+
+
+class TestCacheFile(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.temp_dir.name, "stats.cache")
+        self.arrays = (np.arange(0, 30, 3), np.linspace(0, 1, 10), np.zeros(10), np.ones(10))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def check_round_trip(self):
+        cf.write_stats_cache(self.file_name, *self.arrays, stats="mean_and_std_error", step=3)
+        self.assertTrue(cf.is_binary_cache(self.file_name))
+        header, *arrays = cf.read_stats_cache(self.file_name)
+        self.assertEqual(header["stats"], "mean_and_std_error")
+        self.assertEqual(header["step"], 3)
+        for expected, actual in zip(self.arrays, arrays):
+            np.testing.assert_array_equal(expected, actual)
+        return arrays
+
+    def test_round_trip(self):
+        self.check_round_trip()
+
+    def test_memory_mapped(self):
+        threshold = cf.MMAP_THRESHOLD
+        cf.MMAP_THRESHOLD = 0
+        try:
+            arrays = self.check_round_trip()
+            self.assertIsInstance(arrays[0].base, np.memmap)
+            with open(self.file_name, 'r+b') as cache_file:
+                cache_file.truncate(os.path.getsize(self.file_name) - 1)
+            self.assertRaises(util.CacheError, cf.read_stats_cache, self.file_name)
+        finally:
+            cf.MMAP_THRESHOLD = threshold
+
+    def test_checksum(self):
+        cf.write_stats_cache(self.file_name, *self.arrays)
+        with open(self.file_name, 'r+b') as cache_file:
+            cache_file.seek(-1, os.SEEK_END)
+            cache_file.write(b"x")
+        self.assertRaises(util.CacheError, cf.read_stats_cache, self.file_name)
+
+    def test_text_cache(self):
+        with open(self.file_name, 'w') as cache_file:
+            cache_file.write("0.5 0.1 0.9 0\n")
+        self.assertFalse(cf.is_binary_cache(self.file_name))
+
+
+class TestCacheManager(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.temp_dir.name, "cache")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_get_path(self):
+        self.assertEqual(cm.CacheManager().get_path("data/ch_1.cache"), "data/ch_1.cache")
+        manager = cm.CacheManager(self.cache_dir)
+        self.assertTrue(os.path.isdir(self.cache_dir))
+        path1 = manager.get_path("data1/ch_1.cache")
+        path2 = manager.get_path("data2/ch_1.cache")
+        self.assertEqual(os.path.dirname(path1), self.cache_dir)
+        self.assertTrue(path1.endswith("_ch_1.cache"))
+        self.assertNotEqual(path1, path2)
+
+    def test_evict_least_recently_used(self):
+        manager = cm.CacheManager(self.cache_dir, max_size=250)
+        paths = [manager.get_path("ch_" + str(i) + ".cache") for i in range(3)]
+        for i, path in enumerate(paths):
+            with open(path, 'wb') as cache_file:
+                cache_file.write(b"x" * 100)
+            os.utime(path, (i, i))
+        manager.touch(paths[0])
+        manager.evict()
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertTrue(os.path.exists(paths[2]))
+
+    def test_atomic_open(self):
+        file_name = os.path.join(self.temp_dir.name, "ch_1.cache")
+        with cm.atomic_open(file_name) as cache_file:
+            cache_file.write(b"old")
+        with self.assertRaises(ValueError):
+            with cm.atomic_open(file_name) as cache_file:
+                cache_file.write(b"partial")
+                raise ValueError()
+        with open(file_name, 'rb') as cache_file:
+            self.assertEqual(cache_file.read(), b"old")
+        self.assertEqual(os.listdir(self.temp_dir.name), ["ch_1.cache"])
+
+    @unittest.skipIf(cm.fcntl is None, "File locking not supported")
+    def test_cache_lock(self):
+        file_name = os.path.join(self.temp_dir.name, "ch_1.cache")
+        with cm.CacheLock(file_name):
+            self.assertFalse(cm.CacheLock(file_name).acquire(blocking=False))
+        lock = cm.CacheLock(file_name)
+        self.assertTrue(lock.acquire(blocking=False))
+        lock.release()
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -3,13 +3,20 @@ import collections
 import os
 import sys
 import parse_file as pf
+import cache_manager as cm
 import matplotlib.colors
 import global_options as go
 import hashlib
 import struct
+from concurrent.futures import ThreadPoolExecutor
 from createPlotUtils import debug_print
 
 
+# Options that change the numbers calculated for a treatment. Changing any of
+# them changes the cache key, and thereby the name of the cache files.
+cache_key_options = []
+
+
 def hash_list_of_strings(strings: List[str]):
     new_hash = hashlib.sha1()
     for s in strings:
@@ -44,6 +51,63 @@ def create_prefix(root_directory, files):
     return prefix
 
 
+def get_scan_manifest(directory):
+    """
+    Returns the manifest that remembers the directories listed while looking
+    for the files in the provided treatment directory, or None if scan
+    manifests are disabled. Manifests are only stored in the "cache_dir", as
+    writing one inside the treatment directory would change the directory it
+    describes, and its parent may not be writable.
+    """
+    manager = cm.get_cache_manager()
+    if (not go.get_bool("scan_manifest") or not manager.cache_dir or
+            pf.split_archive_path(directory) is not None):
+        return None
+    parent, base_name = os.path.split(directory)
+    file_name = os.path.join(parent, "ch_scan_" + base_name + ".cache")
+    return pf.ScanManifest(manager.get_path(file_name))
+
+
+def add_cache_key_options(*names):
+    for name in names:
+        if name not in cache_key_options:
+            cache_key_options.append(name)
+
+
+def get_file_manifest(files):
+    """
+    Returns a (path, size, mtime_ns) tuple for every provided file, such that
+    extending or replacing a file changes the manifest.
+    """
+    manifest = []
+    for file in files:
+        stat = pf.stat_data_file(file)
+        manifest.append((file, stat.st_size, stat.st_mtime_ns))
+    return manifest
+
+
+def get_options_fingerprint(names):
+    """
+    Returns a canonical list of strings representing the values of the
+    provided options. Options that are not defined for the current script are
+    skipped.
+    """
+    fingerprint = []
+    for name in names:
+        try:
+            values = go.get_glb(name)
+        except KeyError:
+            continue
+        if hasattr(values, '__call__'):
+            values = values()
+        if not isinstance(values, list):
+            values = [values]
+        fingerprint.append(name)
+        fingerprint.append(str(len(values)))
+        fingerprint += [str(value) for value in values]
+    return fingerprint
+
+
 class Treatment:
     def __init__(self,
                  treatment_id=None,
@@ -63,39 +127,63 @@ class Treatment:
         self.files = []
         self.parts = []
 
+        # Resolving the provided paths, rather than every file found, keeps
+        # symbolic links inside a treatment directory as they are.
+        files_or_directories = [os.path.realpath(file_or_directory)
+                                for file_or_directory in files_or_directories]
+        manifests = dict()
+        for file_or_directory in files_or_directories:
+            if not os.path.isfile(file_or_directory) or pf.is_archive(file_or_directory):
+                manifests[file_or_directory] = get_scan_manifest(file_or_directory)
+        scan_threads = go.get_int("scan_threads")
+        executor = None
+        if scan_threads > 1:
+            executor = ThreadPoolExecutor(max_workers=scan_threads)
+
         if len(self.pool) > 0:
             debug_print("files", "Pooling:", self.pool)
             for directory in files_or_directories:
                 # self.root_directory = directory
-                dirs_current_pool = pf.get_dirs(self.pool, directory)
+                manifest = manifests.get(directory)
+                dirs_current_pool = pf.get_dirs(self.pool, directory, executor, manifest)
                 self.dirs += dirs_current_pool
                 # self.files = []
                 self.files_per_pool = []
                 for pool_dir in self.dirs:
-                    files = pf.get_files(self.templates, pool_dir)
+                    files = pf.get_files(self.templates, pool_dir, executor, manifest)
                     self.files += files
                     self.files_per_pool.append(files)
                 # self.cache_file_name_prefix = (self.root_directory + "/ch_" +
                 #                                self.templates[-1] + "_")
 
         for file_or_directory in files_or_directories:
-            if os.path.isfile(file_or_directory):
+            if file_or_directory not in manifests:
                 debug_print("files", "Retrieving file:", file_or_directory)
                 self.files.append(file_or_directory)
                 self.parts.append([file_or_directory])
             else:
                 debug_print("files", "Retrieving files from directory:", file_or_directory,
                             "with template:", self.templates)
-                files = pf.get_files(self.templates, file_or_directory)
+                files = pf.get_files(self.templates, file_or_directory, executor,
+                                     manifests[file_or_directory])
                 self.files += files
                 self.parts.append(files)
             # self.root_directory = None
             # self.cache_file_name_prefix = "unknown_"
+        if executor is not None:
+            executor.shutdown()
+        for manifest in manifests.values():
+            if manifest is not None and manifest.write():
+                cm.get_cache_manager().add(manifest.file_name)
         if len(self.files) != 0:
-            self.files = [os.path.normpath(os.path.realpath(file)) for file in self.files]
+            self.files = [os.path.normpath(file) for file in self.files]
             self.root_directory = os.path.commonpath(self.files)
             if os.path.isfile(self.root_directory):
                 self.root_directory = os.path.dirname(self.root_directory)
+            in_archive = pf.split_archive_path(self.root_directory)
+            if in_archive is not None:
+                # Cache files are written next to the archive
+                self.root_directory = os.path.dirname(in_archive[0])
             # self.root_directory = os.path.dirname(os.path.realpath(self.files[0]))
             # for file in self.files[1:]:
             #     potential_root = os.path.dirname(os.path.realpath(file))
@@ -108,6 +196,7 @@ class Treatment:
             self.root_directory = ""
             prefix = ""
         self.cache_file_name_prefix = "ch_" + prefix + "_"
+        self.cache_key = None
         self.name = treatment_name
         self.short_name = short_name
         self.id = treatment_id
@@ -144,10 +233,43 @@ class Treatment:
     # def get_cache_file_name(self, plot_id):
     #     return self.root_directory + "/" + str(plot_id) + ".cache"
 
+    def get_cache_key(self):
+        """
+        Returns a hash of the size and modification time of every input file,
+        and of the value of every option in "cache_key_options".
+        """
+        if self.cache_key is None:
+            strings = []
+            for file, size, mtime_ns in get_file_manifest(self.files):
+                strings += [file, str(size), str(mtime_ns)]
+            strings += get_options_fingerprint(cache_key_options)
+            self.cache_key = hash_list_of_strings(strings)[:16]
+            debug_print("files", "cache key:", self.cache_key)
+        return self.cache_key
+
     def get_cache_file_name(self, plot_id, stats=''):
         # if stats == '':
         #     return self.root_directory + "/" + self.cache_file_name_prefix + str(plot_id) + ".cache"
-        return self.root_directory + "/" + self.cache_file_name_prefix + stats + '_' + str(plot_id) + ".cache"
+        return (self.root_directory + "/" + self.cache_file_name_prefix + self.get_cache_key() +
+                "_" + stats + '_' + str(plot_id) + ".cache")
+
+    def get_data_cache_file_name(self, file_name):
+        """
+        Returns the name of the cache holding the parsed data of one of the
+        files of this treatment. The name only depends on the path of that
+        file, such that adding a run leaves the caches of other runs valid.
+        """
+        return (self.root_directory + "/ch_data_" + hash_list_of_strings([file_name])[:16] +
+                "_" + os.path.basename(file_name) + ".cache")
+
+    def get_part_cache_file_name(self, file_names):
+        """
+        Returns the name of the cache holding the values read from one of the
+        directories of this treatment when "one_value_per_dir" is set. The
+        name only depends on the files in that directory, such that adding a
+        directory leaves the caches of other directories valid.
+        """
+        return self.root_directory + "/ch_part_" + hash_list_of_strings(file_names)[:16] + ".cache"
 
     def get_background_color(self):
         back_color = self.background_color
@@ -331,10 +453,18 @@ def add_options():
     #                "to be plotted sequentially.")
     go.add_option("pool",
                   help_str="Pool the results in this directory together by taking the "
-                           "maximum. Accepts regular expressions.")
+                           "maximum, or as set by pool_reducer. Accepts regular expressions.")
     go.add_option("templates", ".*",
                   help_str="Directories to traverse to find files to plot. "
                            "Accepts regular expressions.")
+    go.add_option("scan_threads", 8, nargs=1,
+                  help_str="Number of threads used to list the directories at the same "
+                           "depth of a treatment directory while looking for input files.")
+    go.add_option("scan_manifest", True, nargs=1,
+                  help_str="If true, the contents of every directory listed while looking "
+                           "for input files are stored in a manifest in the cache_dir, and "
+                           "are reused until the modification time of that directory "
+                           "changes. Has no effect when cache_dir is not set.")
     go.add_option("treatment_root_dir", def_treatment_root_dir,
                   help_str="Treatment directories and files are assumed to be relative"
                            "to this directory.")